@@ -0,0 +1,186 @@
+"""
+Measure how config loading, validation, target resolution and scheduling
+scale with the number of images, using synthetic configs. Every run is
+appended to a JSONL history and compared with the previous run:
+
+    python benchmark/scaling.py [--sizes 10 100 1000 10000]
+"""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import yaml
+
+from synthetic import generate_images
+from wake_build import wake
+from wake_build.config import (
+    get_dependency_targets,
+    get_image_graph,
+    get_matching_targets,
+    load_config,
+    validate_images_dependencies,
+    validate_images_schema,
+)
+from wake_build.executor import SimulatedExecutor
+from wake_build.history import BuildHistory
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+
+def best_time(func, repeat):
+    """
+    Return the fastest of `repeat` timed calls to func, which is the least
+    noisy estimate of its cost
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_size(size, repeat, jobs):
+    images = generate_images(size)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Wakefile.yaml")
+        with open(path, "w") as file:
+            yaml.safe_dump(images, file)
+        cache_dir = os.path.join(directory, "cache")
+        results["load_config"] = best_time(lambda: load_config(path), repeat)
+        load_config(path, cache_dir=cache_dir)
+        results["load_config_cached"] = best_time(
+            lambda: load_config(path, cache_dir=cache_dir), repeat
+        )
+    results["validate_schema"] = best_time(
+        lambda: validate_images_schema(images), repeat
+    )
+    results["validate_dependencies"] = best_time(
+        lambda: validate_images_dependencies(images), repeat
+    )
+    graph = get_image_graph(images)
+    leaves = [
+        f"image{index}" for index in range(max(size - 10, size // 2), size)
+    ]
+    results["get_matching_targets"] = best_time(
+        lambda: get_matching_targets(graph, leaves, "build"), repeat
+    )
+    results["get_dependency_targets"] = best_time(
+        lambda: [
+            get_dependency_targets(graph, target, "build")
+            for target in get_matching_targets(graph, leaves, "build")
+        ],
+        repeat,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        # Real runs always schedule by the priorities a history provides
+        results["schedule_all"] = best_time(
+            lambda: wake.build_tag_push_images(
+                images,
+                jobs=jobs,
+                retries=0,
+                executor=SimulatedExecutor(),
+                history=BuildHistory(directory),
+            ),
+            repeat,
+        )
+    return results
+
+
+def scaling_exponents(sizes, runs):
+    """
+    Return the slope of log(time) against log(size) between consecutive
+    sizes for each measurement, where 1 is linear scaling
+    """
+    exponents = {}
+    for small, large in zip(sizes, sizes[1:]):
+        for name, duration in runs[str(large)].items():
+            previous = runs[str(small)][name]
+            if previous > 0 and duration > 0:
+                exponents.setdefault(name, []).append(
+                    math.log(duration / previous) / math.log(large / small)
+                )
+    return exponents
+
+
+def load_previous(history_path):
+    try:
+        with open(history_path, "r") as file:
+            lines = [line for line in file if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def git_commit():
+    proc = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc.stdout.decode().strip() or None
+
+
+def main():
+    parser = ArgumentParser("scaling")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--history", type=str, default=DEFAULT_HISTORY)
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    runs = {}
+    for size in sizes:
+        runs[str(size)] = benchmark_size(size, args.repeat, args.jobs)
+        for name, duration in runs[str(size)].items():
+            sys.stdout.write(
+                f"{size:>6} {name:<24} {duration * 1000:10.2f}ms\n"
+            )
+    for name, exponents in scaling_exponents(sizes, runs).items():
+        sys.stdout.write(
+            f"scaling {name:<24} "
+            + " ".join(f"{exponent:5.2f}" for exponent in exponents)
+            + "\n"
+        )
+
+    previous = load_previous(args.history)
+    regressions = []
+    if previous is not None:
+        for size, results in runs.items():
+            for name, duration in results.items():
+                baseline = previous["results"].get(size, {}).get(name)
+                if baseline and duration > baseline * args.threshold:
+                    regressions.append(
+                        f"{name} with {size} images: "
+                        f"{baseline * 1000:.2f}ms -> {duration * 1000:.2f}ms"
+                    )
+    for regression in regressions:
+        sys.stdout.write(f"Regression: {regression}\n")
+
+    with open(args.history, "a") as file:
+        record = {
+            "time": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "results": runs,
+        }
+        file.write(json.dumps(record) + "\n")
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Measure how long the wake entry point takes to start, as the median of
+several runs in fresh interpreters:
+
+    python benchmark/startup.py [--runs N]
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+
+def import_time():
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wake_build.wake"],
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    for line in proc.stderr.decode().splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "wake_build":
+            return int(fields[1]) / 1e6
+    raise RuntimeError("wake_build missing from import time output")
+
+
+def help_time():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "wake_build", "--help"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser("startup")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    for name, measure in [("import", import_time), ("wake --help", help_time)]:
+        samples = [measure() for _ in range(args.runs)]
+        sys.stdout.write(
+            f"{name:<12} median {statistics.median(samples) * 1000:7.1f}ms"
+            f"  min {min(samples) * 1000:7.1f}ms\n"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import random
+
+
+def generate_images(count, seed=0, fan_in=3):
+    """
+    Generate a config of `count` images shaped like a real monorepo: a few
+    pulled base images, a layer of shared runtime images built on them and
+    many leaf services, each depending on up to `fan_in` earlier images.
+    Popular images attract more dependents, giving a few wide fan-outs and
+    a long tail, as in real image graphs.
+    """
+    rng = random.Random(seed)
+    pulled = max(1, count // 50)
+    shared = max(1, count // 10)
+    # Each image appears once plus once per dependent, so choosing uniformly
+    # from these lists is preferential attachment
+    tickets = []
+    base_tickets = []
+    images = []
+    for index in range(count):
+        name = f"image{index}"
+        is_shared = index < pulled + shared
+        if index < pulled:
+            image = {"name": name, "tag": "1.0", "actions": ["pull"]}
+        else:
+            # Shared images only build on base images, leaves on anything
+            pool = base_tickets if is_shared else tickets
+            chosen = {rng.choice(pool) for _ in range(rng.randint(1, fan_in))}
+            image = {
+                "name": name,
+                "tag": "1.0",
+                "dependencies": [
+                    {"name": f"image{dep}", "tag": "1.0"}
+                    for dep in sorted(chosen)
+                ],
+                "actions": (
+                    ["build"] if is_shared else ["build", "tag", "push"]
+                ),
+            }
+            for dep in chosen:
+                tickets.append(dep)
+                if dep < pulled:
+                    base_tickets.append(dep)
+        images.append(image)
+        tickets.append(index)
+        if index < pulled:
+            base_tickets.append(index)
+    return images
@@ -0,0 +1,99 @@
+import json
+import os
+import re
+
+from wake_build.config import get_image_graph
+from wake_build.docker import get_build_args, get_cache_from, image_reference
+from wake_build.executor import get_executor
+
+BAKE_FILE = "docker-bake.json"
+
+
+def bake_target_name(key):
+    """
+    Bake target names may only contain letters, digits, `-` and `_`
+    """
+    return re.sub(r"[^A-Za-z0-9_-]", "_", "_".join(key))
+
+
+def bake_definition(images_data, build_targets):
+    """
+    Translate the build targets into a bake definition with one target per
+    image. Dependencies that are built in the same bake are linked through
+    named contexts, so BuildKit builds shared stages once and feeds them
+    directly to dependent targets.
+    """
+    graph = get_image_graph(images_data)
+    build_targets = set(build_targets)
+    targets = {}
+    for key in graph.topological_order(build_targets):
+        image = graph.get(key)
+        context = image.get("context", ".")
+        target = {
+            "context": context,
+            "tags": [image_reference(image)],
+            "output": ["type=docker"],
+        }
+        if "dockerfile" in image:
+            target["dockerfile"] = os.path.relpath(image["dockerfile"], context)
+        if "target" in image:
+            target["target"] = image["target"]
+        if "platform" in image:
+            target["platforms"] = [image["platform"]]
+        build_args = get_build_args(image)
+        if build_args:
+            target["args"] = build_args
+        cache_from = get_cache_from(image)
+        if cache_from:
+            target["cache-from"] = cache_from
+        if image.get("cache_to"):
+            target["cache-to"] = image["cache_to"]
+        linked = {
+            f"docker-image://{':'.join(dep)}": f"target:{bake_target_name(dep)}"
+            for dep in graph.dependencies(key)
+            if dep in build_targets
+        }
+        # Per-platform variants name their dependencies by the reference the
+        # dockerfile uses rather than by the variant's own reference
+        contexts = {
+            name: linked.pop(source, source)
+            for name, source in image.get("build_contexts", {}).items()
+        }
+        contexts.update(
+            {
+                source[len("docker-image://") :]: target
+                for source, target in linked.items()
+            }
+        )
+        if contexts:
+            target["contexts"] = contexts
+        targets[bake_target_name(key)] = target
+    return {
+        "group": {"default": {"targets": list(targets)}},
+        "target": targets,
+    }
+
+
+def bake_images(
+    images_data,
+    build_targets,
+    bake_file,
+    dry_run=False,
+    live_output=False,
+    output=None,
+    executor=None,
+) -> bool:
+    """
+    Write a bake definition for the build targets and build them all with a
+    single `docker buildx bake` invocation
+    """
+    definition = bake_definition(images_data, build_targets)
+    bake_dir = os.path.dirname(bake_file)
+    if bake_dir:
+        os.makedirs(bake_dir, exist_ok=True)
+    with open(bake_file, "w") as file:
+        json.dump(definition, file, indent=2)
+    cmd = ["docker", "buildx", "bake", "--file", bake_file, "default"]
+    return get_executor(executor, dry_run).run(
+        cmd, live_output=live_output, output=output
+    )
@@ -0,0 +1,193 @@
+import threading
+
+from wake_build.docker import image_reference, pull_image
+from wake_build.executor import CommandExecutor, get_executor
+from wake_build.log import logger
+
+
+class Builder:
+    """
+    A docker daemon steps can run on, given as a docker context name or as
+    a daemon address such as `tcp://builder1:2375` or `ssh://user@host`
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        if "://" in spec:
+            self.args = ["--host", spec]
+        else:
+            self.args = ["--context", spec]
+
+    def __repr__(self):
+        return self.spec
+
+
+class BuilderExecutor(CommandExecutor):
+    """
+    Runs docker commands against a builder through another executor
+    """
+
+    def __init__(self, builder, executor):
+        self.builder = builder
+        self.executor = executor
+        self.real = executor.real
+
+    def run(self, command, live_output=False, output=None, stdin=None) -> bool:
+        if command[:1] == ["docker"]:
+            command = ["docker", *self.builder.args, *command[1:]]
+        return self.executor.run(
+            command, live_output=live_output, output=output, stdin=stdin
+        )
+
+    def cancel(self):
+        self.executor.cancel()
+
+
+class BuilderPool:
+    """
+    Assigns steps to builders, each running up to `slots` steps at once. A
+    step goes to the free builder that already holds the most of the images
+    it needs, and any it lacks are copied over from a builder holding them,
+    pulled, or copied from the local daemon. Images no builder holds are
+    assumed to be on the local daemon, so steps on them run there.
+    """
+
+    def __init__(self, specs, slots=1, executor=None, dry_run=False):
+        self.builders = [Builder(spec) for spec in specs]
+        self.slots = slots
+        self.executor = get_executor(executor, dry_run)
+        self.running = {builder.spec: 0 for builder in self.builders}
+        # Builders holding each image, and the builder that built it
+        self.holders = {}
+        self.origins = {}
+        self.transfers = 0
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.builders)
+
+    def held(self, key):
+        with self.condition:
+            return set(self.holders.get(key, ()))
+
+    def record(self, key, builder):
+        with self.condition:
+            self.holders.setdefault(key, set()).add(builder.spec)
+
+    def acquire(self, keys, required=None):
+        """
+        Wait for a free slot and return the builder to run a step needing
+        the images `keys` on, preferring builders that hold more of them.
+        With `required`, wait for a slot on that builder.
+        """
+        with self.condition:
+            while True:
+                free = [
+                    builder
+                    for builder in self.builders
+                    if self.running[builder.spec] < self.slots
+                    and required in [None, builder]
+                ]
+                if free:
+                    break
+                self.condition.wait()
+            builder = max(
+                free,
+                key=lambda builder: (
+                    sum(
+                        builder.spec in self.holders.get(key, ())
+                        for key in keys
+                    ),
+                    -self.running[builder.spec],
+                ),
+            )
+            self.running[builder.spec] += 1
+            return builder
+
+    def release(self, builder):
+        with self.condition:
+            self.running[builder.spec] -= 1
+            self.condition.notify_all()
+
+    def provide(self, images_data, key, builder, live_output, output):
+        """
+        Make sure the builder holds the image `key`, returning whether it does
+        """
+        holders = self.held(key)
+        if builder.spec in holders:
+            return True
+        image = images_data.get(key)
+        if holders:
+            source = next(b for b in self.builders if b.spec in holders)
+            source_args = source.args
+        elif "pull" in image["actions"]:
+            success = pull_image(
+                image,
+                live_output=live_output,
+                output=output,
+                executor=BuilderExecutor(builder, self.executor),
+            )
+            if success:
+                self.record(key, builder)
+            return success
+        else:
+            source, source_args = "the local daemon", []
+        reference = image_reference(image)
+        logger.info(f"Copying {reference} from {source} to {builder}")
+        success = self.executor.transfer(
+            reference,
+            source_args,
+            builder.args,
+            live_output=live_output,
+            output=output,
+        )
+        if success:
+            with self.condition:
+                self.transfers += 1
+            self.record(key, builder)
+        return success
+
+    def run(
+        self,
+        images_data,
+        action,
+        key,
+        func,
+        live_output=False,
+        output=None,
+    ):
+        """
+        Run func(executor) for an action on the image `key` on a builder.
+        Builds get the images they depend on first; other actions run where
+        the image was built, or locally if no builder built it.
+        """
+        if action == "build":
+            needed = list(images_data.dependencies(key))
+            builder = self.acquire(needed)
+        else:
+            with self.condition:
+                origin = self.origins.get(key)
+            if origin is None:
+                return func(self.executor)
+            needed = []
+            builder = self.acquire(needed, required=origin)
+        try:
+            for dep in needed:
+                if not self.provide(
+                    images_data, dep, builder, live_output, output
+                ):
+                    return False
+            success = func(BuilderExecutor(builder, self.executor))
+            if success and action == "build":
+                self.record(key, builder)
+                with self.condition:
+                    self.origins[key] = builder
+            return success
+        finally:
+            self.release(builder)
+
+    def log_summary(self):
+        logger.info(
+            f"Builders: {len(self.builders)} used, "
+            f"{self.transfers} images copied between them"
+        )
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+
+from wake_build.config import get_image_config
+from wake_build.context import iter_context_files
+from wake_build.docker import image_reference, inspect_image
+from wake_build.log import logger
+
+BUILD_CACHE_FILE = "build-cache.json"
+
+
+def get_cache_dir(cache_dir=None):
+    """
+    Return the directory wake keeps its state in: cache_dir if given, then
+    $WAKE_CACHE_DIR, and otherwise one per working directory under the user
+    cache dir, outside of the "." context images build from by default
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get("WAKE_CACHE_DIR")
+    if cache_dir is None:
+        user_cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        key = hashlib.sha256(os.getcwd().encode()).hexdigest()[:16]
+        cache_dir = os.path.join(user_cache, "wake", key)
+    return cache_dir
+
+
+def hash_directory(path, exclude=()):
+    """
+    Hash the relative path, executable bit and content of every file below
+    path that is sent to the builder, skipping files excluded by the
+    context's .dockerignore and anything at or below the paths in exclude,
+    in a stable order
+    """
+    digest = hashlib.sha256()
+    for relative_path in iter_context_files(path, exclude=exclude):
+        file_path = os.path.join(path, relative_path)
+        if os.path.islink(file_path):
+            digest.update(relative_path.encode() + b"\0")
+            digest.update(b"link\0" + os.readlink(file_path).encode())
+            continue
+        if os.path.isdir(file_path):
+            continue
+        digest.update(relative_path.encode() + b"\0")
+        digest.update(b"x" if os.access(file_path, os.X_OK) else b"-")
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class Fingerprinter:
+    """
+    Computes a fingerprint for each image from everything that can change
+    the result of building it: its context, dockerfile, target, build args,
+    resolved env args and the fingerprints of its dependencies. Dependencies
+    that are not built by wake contribute their local image ID instead.
+    """
+
+    def __init__(self, images_data, exclude=(), client=None):
+        self.images_data = images_data
+        self.exclude = exclude
+        self.client = client
+        self.fingerprints = {}
+        self.context_hashes = {}
+        self.lock = threading.Lock()
+
+    def context_hash(self, context):
+        context = os.path.abspath(context)
+        with self.lock:
+            if context in self.context_hashes:
+                return self.context_hashes[context]
+        context_hash = hash_directory(context, exclude=self.exclude)
+        with self.lock:
+            self.context_hashes[context] = context_hash
+        return context_hash
+
+    def fingerprint(self, target):
+        with self.lock:
+            if target in self.fingerprints:
+                return self.fingerprints[target]
+        image = get_image_config(self.images_data, target)
+        if "build" not in image["actions"]:
+            info = inspect_image(image_reference(image), client=self.client)
+            fingerprint = info["Id"] if info else None
+        else:
+            fingerprint = self.compute(image)
+        with self.lock:
+            self.fingerprints[target] = fingerprint
+        return fingerprint
+
+    def compute(self, image):
+        context = image.get("context", ".")
+        dockerfile = image.get(
+            "dockerfile", os.path.join(context, "Dockerfile")
+        )
+        inputs = {
+            "context": self.context_hash(context),
+            "dockerfile": hash_file(dockerfile),
+            "target": image.get("target"),
+            "build_args": image.get("build_args", {}),
+            "env_args": {
+                key: os.environ.get(key, "")
+                for key in image.get("env_args", [])
+            },
+            "dependencies": {
+                f"{dep['name']}:{dep['tag']}": self.fingerprint(
+                    (dep["name"], dep["tag"])
+                )
+                for dep in image.get("dependencies", [])
+            },
+        }
+        if "platform" in image:
+            inputs["platform"] = image["platform"]
+        encoded = json.dumps(inputs, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+
+class BuildCache:
+    """
+    Records the fingerprint each image was last built from, so builds whose
+    inputs are unchanged can be skipped while the image still exists locally
+    """
+
+    def __init__(
+        self,
+        images_data,
+        cache_dir,
+        force=False,
+        client=None,
+        exclude=(),
+        fingerprinter=None,
+    ):
+        self.path = os.path.join(cache_dir, BUILD_CACHE_FILE)
+        self.force = force
+        self.client = client
+        # Wake's own outputs may sit inside a context without being inputs
+        if fingerprinter is None:
+            fingerprinter = Fingerprinter(
+                images_data, exclude=[cache_dir, *exclude], client=client
+            )
+        self.fingerprinter = fingerprinter
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r") as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def is_fresh(self, image):
+        """
+        Return whether image was built from the same inputs and still exists
+        """
+        reference = image_reference(image)
+        fingerprint = self.fingerprinter.fingerprint(
+            (image["name"], image["tag"])
+        )
+        fresh = (
+            not self.force
+            and self.entries.get(reference) == fingerprint
+            and inspect_image(reference, client=self.client) is not None
+        )
+        with self.lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return fresh
+
+    def record(self, image):
+        reference = image_reference(image)
+        fingerprint = self.fingerprinter.fingerprint(
+            (image["name"], image["tag"])
+        )
+        with self.lock:
+            self.entries[reference] = fingerprint
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.entries, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def log_summary(self):
+        logger.info(f"Build cache: {self.hits} hits, {self.misses} misses")
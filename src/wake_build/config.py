@@ -1,8 +1,10 @@
 import os
 import json
-import yaml
+import re
 
+from wake_build.context import is_ignored, read_dockerignore
 from wake_build.exc import NoConfigFoundException
+from wake_build.log import logger
 
 
 def validate_images_schema(images):
@@ -47,6 +49,39 @@ def validate_images_schema(images):
             raise ValueError(
                 "Incorrect field type in image: dockerfile must be type str"
             )
+        for field in ["cache_from", "cache_to"]:
+            if field not in image:
+                continue
+            if not isinstance(image[field], list):
+                raise ValueError(
+                    f"Incorrect field type in image: {field} must be type list"
+                )
+            for spec in image[field]:
+                if not isinstance(spec, str):
+                    raise ValueError(
+                        f"Incorrect field type in image: {field} entries must be type string"
+                    )
+        if "resources" in image:
+            validate_resources(image["resources"])
+        if "platforms" in image:
+            if (
+                not isinstance(image["platforms"], list)
+                or not image["platforms"]
+            ):
+                raise ValueError(
+                    "Incorrect field type in image: platforms must be a non-empty list"
+                )
+            for platform in image["platforms"]:
+                if not isinstance(platform, str) or not re.fullmatch(
+                    PLATFORM_PATTERN, platform
+                ):
+                    raise ValueError(
+                        f"Incorrect field value in image: platform {platform!r} must look like 'linux/amd64' or 'linux/arm/v7'"
+                    )
+            if len(set(image["platforms"])) != len(image["platforms"]):
+                raise ValueError(
+                    "Incorrect field value in image: platforms must not repeat"
+                )
         if "dependencies" in image:
             if not isinstance(image["dependencies"], list):
                 raise ValueError(
@@ -69,6 +104,162 @@ def validate_images_schema(images):
                     )
 
 
+def validate_resources(resources):
+    if not isinstance(resources, dict):
+        raise ValueError(
+            "Incorrect field type in image: resources must be type dict"
+        )
+    for field in resources:
+        if field not in RESOURCES:
+            raise ValueError(
+                "Incorrect field in image resources: must be one of 'cpu', 'memory'"
+            )
+    if "cpu" in resources and (
+        isinstance(resources["cpu"], bool)
+        or not isinstance(resources["cpu"], (int, float))
+        or resources["cpu"] < 0
+    ):
+        raise ValueError(
+            "Incorrect field value in image resources: cpu must be a non-negative number"
+        )
+    if "memory" in resources:
+        parse_memory(resources["memory"])
+
+
+# Resources an image can declare, in the order demands are compared
+RESOURCES = ["cpu", "memory"]
+MEMORY_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_memory(value) -> int:
+    """
+    Parse an amount of memory given as bytes or as a number with a unit
+    suffix such as `512m` or `4g`, like docker's --memory, into bytes
+    """
+    match = None
+    if isinstance(value, str):
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmgt]?)b?", value.lower())
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)()", str(value))
+    if match is None:
+        raise ValueError(
+            f"Incorrect memory amount: {value!r}, expected bytes or a number with a k, m, g or t suffix"
+        )
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+def get_resource_demand(image) -> tuple:
+    """
+    Return the (cpu, memory in bytes) an image declares it needs to build,
+    counting undeclared resources as zero
+    """
+    resources = image.get("resources", {})
+    return (
+        resources.get("cpu", 0),
+        parse_memory(resources.get("memory", 0)),
+    )
+
+
+PLATFORM_PATTERN = r"[a-z0-9_]+/[a-z0-9_]+(/[a-z0-9_]+)?"
+
+
+def is_multi_platform(image) -> bool:
+    """
+    Return whether an image is built separately for each of its platforms
+    """
+    return "platforms" in image and "build" in image["actions"]
+
+
+def platform_tag(tag, platform) -> str:
+    return f"{tag}-{platform.replace('/', '-')}"
+
+
+def platform_variants(image) -> list:
+    """
+    Return the keys of the per-platform variants of a multi-platform image
+    """
+    return [
+        (image["name"], platform_tag(image["tag"], platform))
+        for platform in image["platforms"]
+    ]
+
+
+def expand_platforms(images) -> list:
+    """
+    Fan every multi-platform image out into a variant per platform, tagged
+    `<tag>-<os>-<arch>`, that is built, tagged and pushed like any other
+    image. A variant depends on the variants of its dependencies for the
+    same platform, and a build context points the dependency's reference at
+    that variant. The image itself depends on its variants and its push
+    assembles them into a manifest list. Raises ValueError when an image
+    depends on a multi-platform image that is not built for its platforms.
+    """
+    by_key = {(image["name"], image["tag"]): image for image in images}
+
+    def multi_platform_dependency(dep):
+        dep_image = by_key.get((dep["name"], dep["tag"]))
+        return dep_image if dep_image and is_multi_platform(dep_image) else None
+
+    expanded = []
+    for image in images:
+        reference = f"{image['name']}:{image['tag']}"
+        if not is_multi_platform(image):
+            for dep in image.get("dependencies", []):
+                if multi_platform_dependency(dep):
+                    raise ValueError(
+                        f"Image {reference} depends on multi-platform image {dep['name']}:{dep['tag']} and must list its platforms"
+                    )
+            expanded.append(image)
+            continue
+        for platform in image["platforms"]:
+            variant = {
+                field: value
+                for field, value in image.items()
+                if field != "platforms"
+            }
+            variant["tag"] = platform_tag(image["tag"], platform)
+            variant["platform"] = platform
+            variant["actions"] = [
+                action
+                for action in image["actions"]
+                if action in ["build", "tag", "push"]
+            ]
+            dependencies = []
+            build_contexts = {}
+            for dep in image.get("dependencies", []):
+                dep_image = multi_platform_dependency(dep)
+                if dep_image is None:
+                    dependencies.append(dep)
+                    continue
+                if platform not in dep_image["platforms"]:
+                    raise ValueError(
+                        f"Image {reference} is built for {platform} but its dependency {dep['name']}:{dep['tag']} is not"
+                    )
+                dep_tag = platform_tag(dep["tag"], platform)
+                dependencies.append({"name": dep["name"], "tag": dep_tag})
+                build_contexts[f"{dep['name']}:{dep['tag']}"] = (
+                    f"docker-image://{dep['name']}:{dep_tag}"
+                )
+            if dependencies:
+                variant["dependencies"] = dependencies
+            if build_contexts:
+                variant["build_contexts"] = build_contexts
+            expanded.append(variant)
+        expanded.append(
+            {
+                **image,
+                "dependencies": [
+                    {"name": name, "tag": tag}
+                    for name, tag in platform_variants(image)
+                ],
+            }
+        )
+    return expanded
+
+
+CONFIG_CACHE_FILE = "config-cache.json"
+
+
 def load_json(path):
     try:
         with open(path, "r") as file:
@@ -78,75 +269,284 @@ def load_json(path):
 
 
 def load_yaml(path):
+    # Deferred as pyyaml is slow to import and only needed for YAML configs
+    import yaml
+
+    # Prefer the libyaml based loader when pyyaml was built with it
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     try:
-        try:
-            with open(path, "r") as file:
-                return yaml.safe_load(file)
-        except yaml.composer.ComposerError:
-            with open(path, "r") as file:
-                return list(yaml.safe_load_all(file))
+        with open(path, "r") as file:
+            documents = list(yaml.load_all(file, Loader=loader))
     except yaml.YAMLError as e:
         raise ValueError(f"Error loading YAML file: {e}")
+    if len(documents) == 1:
+        return documents[0]
+    return documents
+
+
+def load_file(path):
+    """
+    Load a config file with the parser matching its extension, falling back
+    to trying each parser for files without a known extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        load_methods = [load_json]
+    elif extension in [".yml", ".yaml"]:
+        load_methods = [load_yaml]
+    else:
+        load_methods = [load_json, load_yaml]
+    for load_method in load_methods:
+        try:
+            return load_method(path)
+        except ValueError:
+            continue
+    return None
+
 
+class ConfigCache:
+    """
+    Parsed config files keyed by path, reused while the file's mtime and size
+    are unchanged so repeated invocations skip parsing entirely
+    """
 
-def load_config(location):
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, CONFIG_CACHE_FILE)
+        self.dirty = False
+        try:
+            with open(self.path, "r") as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def load(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if (
+            entry is not None
+            and entry["mtime"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            return entry["data"]
+        data = load_file(path)
+        try:
+            # Only cache data that round-trips through JSON unchanged
+            json.dumps(data)
+        except (TypeError, ValueError):
+            return data
+        self.entries[key] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "data": data,
+        }
+        self.dirty = True
+        return data
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.entries, file)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def load_config(location, cache_dir=None):
     configs = []
+    config_cache = ConfigCache(cache_dir) if cache_dir is not None else None
+    load = config_cache.load if config_cache is not None else load_file
     try:
         if os.path.isdir(location):
-            for filename in os.listdir(location):
-                for load_method in [load_json, load_yaml]:
-                    try:
-                        data = load_method(os.path.join(location, filename))
-                        if isinstance(data, dict):
-                            configs.append(data)
-                        elif isinstance(data, list):
-                            configs.extend(data)
-                        break
-                    except ValueError:
-                        continue
+            paths = [
+                os.path.join(location, filename)
+                for filename in sorted(os.listdir(location))
+                if os.path.isfile(os.path.join(location, filename))
+            ]
         else:
-            for load_method in [load_json, load_yaml]:
-                try:
-                    data = load_method(location)
-                    if isinstance(data, dict):
-                        configs.append(data)
-                    elif isinstance(data, list):
-                        configs.extend(data)
-                    break
-                except ValueError:
-                    continue
-        return configs
+            paths = [location]
+        for path in paths:
+            data = load(path)
+            if isinstance(data, dict):
+                configs.append(data)
+            elif isinstance(data, list):
+                configs.extend(data)
     except FileNotFoundError:
         raise NoConfigFoundException(location)
+    if config_cache is not None:
+        try:
+            config_cache.save()
+        except OSError as e:
+            logger.warning(f"Unable to write config cache: {e}")
+    return configs
+
+
+class ImageNode:
+    __slots__ = ("key", "config", "dependencies", "dependents")
+
+    def __init__(self, key, config):
+        self.key = key
+        self.config = config
+        self.dependencies = []
+        self.dependents = []
+
+
+class ImageGraph:
+    """
+    Index of image configs by (name, tag) with adjacency lists in both
+    directions, so lookups are constant time and graph walks are linear in
+    the number of images and dependencies. Iterating yields image configs in
+    their original order.
+    """
+
+    def __init__(self, images):
+        self.images = list(images)
+        self.nodes = {}
+        self.by_name = {}
+        for image in self.images:
+            key = (image["name"], image["tag"])
+            if key in self.nodes:
+                continue
+            node = ImageNode(key, image)
+            self.nodes[key] = node
+            self.by_name.setdefault(image["name"], []).append(node)
+        for node in self.nodes.values():
+            for dep in node.config.get("dependencies", []):
+                dep_key = (dep["name"], dep["tag"])
+                if dep_key in self.nodes and dep_key not in node.dependencies:
+                    node.dependencies.append(dep_key)
+                    self.nodes[dep_key].dependents.append(node.key)
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __len__(self):
+        return len(self.images)
+
+    def __contains__(self, key):
+        return key in self.nodes
+
+    def get(self, key):
+        node = self.nodes.get(key)
+        return node.config if node is not None else None
+
+    def dependencies(self, key):
+        return self.nodes[key].dependencies
+
+    def dependents(self, key):
+        return self.nodes[key].dependents
+
+    def with_action(self, action):
+        return [
+            key
+            for key, node in self.nodes.items()
+            if action in node.config["actions"]
+        ]
+
+    def closure(self, keys, reverse=False):
+        """
+        Return the given keys plus everything they transitively depend on, or
+        everything that transitively depends on them if reverse is set
+        """
+        seen = set()
+        stack = [key for key in keys if key in self.nodes]
+        while stack:
+            key = stack.pop()
+            if key in seen:
+                continue
+            seen.add(key)
+            node = self.nodes[key]
+            stack.extend(node.dependents if reverse else node.dependencies)
+        return seen
+
+    def topological_order(self, keys=None):
+        """
+        Return keys (default all images) ordered so that every image comes
+        after its dependencies, raising ValueError on a circular dependency
+        """
+        keys = set(self.nodes if keys is None else keys)
+        waiting_on = {
+            key: sum(1 for dep in self.nodes[key].dependencies if dep in keys)
+            for key in keys
+        }
+        ready = [
+            key for key in self.nodes if key in keys and not waiting_on[key]
+        ]
+        order = []
+        while ready:
+            key = ready.pop()
+            order.append(key)
+            for dependent in self.nodes[key].dependents:
+                if dependent in waiting_on:
+                    waiting_on[dependent] -= 1
+                    if not waiting_on[dependent]:
+                        ready.append(dependent)
+        if len(order) != len(keys):
+            raise ValueError("Circular dependency detected")
+        return order
+
+    def find_cycle(self):
+        """
+        Return a list of keys forming a circular dependency, starting and
+        ending with the same key, or None if the graph is acyclic
+        """
+        visiting, visited = 1, 2
+        state = {}
+        for root in self.nodes:
+            if root in state:
+                continue
+            state[root] = visiting
+            path = [root]
+            stack = [iter(self.nodes[root].dependencies)]
+            while stack:
+                dep = next(stack[-1], None)
+                if dep is None:
+                    state[path.pop()] = visited
+                    stack.pop()
+                elif state.get(dep) == visiting:
+                    return path[path.index(dep) :] + [dep]
+                elif dep not in state:
+                    state[dep] = visiting
+                    path.append(dep)
+                    stack.append(iter(self.nodes[dep].dependencies))
+        return None
+
+
+def get_image_graph(images_data) -> ImageGraph:
+    if isinstance(images_data, ImageGraph):
+        return images_data
+    return ImageGraph(images_data)
 
 
 def get_image_config(images_config, name_tag: tuple):
-    name, tag = name_tag
-    for image in images_config:
-        if image["name"] == name and image["tag"] == tag:
-            return image
-    return None
+    return get_image_graph(images_config).get(tuple(name_tag))
 
 
 def get_matching_targets(images_data, targets, action):
+    graph = get_image_graph(images_data)
     matches = []
     for target in targets:
-        found = False
         split = target.split(":")
         if len(split) == 1:
-            for image in filter(lambda x: action in x["actions"], images_data):
-                if image["name"] == split[0]:
-                    found = True
-                    matches.append((image["name"], image["tag"]))
+            found = [
+                node.key
+                for node in graph.by_name.get(split[0], [])
+                if action in node.config["actions"]
+            ]
         elif len(split) == 2:
-            for image in filter(lambda x: action in x["actions"], images_data):
-                if image["name"] == split[0] and image["tag"] == split[1]:
-                    found = True
-                    matches.append((image["name"], image["tag"]))
+            node = graph.nodes.get(tuple(split))
+            found = (
+                [node.key]
+                if node is not None and action in node.config["actions"]
+                else []
+            )
         else:
             raise ValueError(f"Invalid target format: {target}")
         if not found:
             raise ValueError(f"Target {target} not found for action {action}")
+        matches.extend(found)
     return matches
 
 
@@ -154,43 +554,150 @@ def get_dependency_targets(images_data, target, action) -> set:
     """
     Get the dependencies of a target image that have the specified action
     """
-    # Get all images that have the specified action, regardless if it's a dependency
-    action_targets = [
-        (image["name"], image["tag"])
-        for image in filter(lambda x: action in x["actions"], images_data)
-    ]
-    
-    # Get all recursive dependencies of the target image
-    all_dependencies = set([target])
-    while True:
-        before_len = len(all_dependencies)
-        for image in all_dependencies.copy():
-            all_dependencies.update(
-                set(
-                    [
-                        (dep["name"], dep["tag"])
-                        for dep in get_image_config(images_data, image).get("dependencies", [])
-                    ]
-                )
-            )
-        if len(all_dependencies) == before_len:
-            break
+    graph = get_image_graph(images_data)
+    # All recursive dependencies of the target image, including itself
+    all_dependencies = graph.closure([tuple(target)])
+    # Return only the dependencies that have the specified action
+    return {
+        key
+        for key in all_dependencies
+        if action in graph.nodes[key].config["actions"]
+    }
+
+
+def get_affected_targets(images_data, changed_paths) -> set:
+    """
+    Get the images whose build inputs include any of the changed paths, plus
+    every image that transitively depends on them. Paths are relative to the
+    working directory, like the context and dockerfile fields, and changes to
+    files excluded by a context's .dockerignore are not counted.
+    """
+    graph = get_image_graph(images_data)
+    changed_paths = [os.path.normpath(path) for path in changed_paths]
+    affected = set()
+    for key in graph.with_action("build"):
+        image = graph.get(key)
+        context = os.path.normpath(image.get("context", "."))
+        dockerfile = os.path.normpath(
+            image.get("dockerfile", os.path.join(context, "Dockerfile"))
+        )
+        patterns = None
+        for path in changed_paths:
+            if path == dockerfile:
+                affected.add(key)
+                break
+            if context == ".":
+                relative = path
+            elif path.startswith(context + os.sep):
+                relative = path[len(context) + 1 :]
+            else:
+                continue
+            if patterns is None:
+                patterns = read_dockerignore(context)
+            if not is_ignored(relative.replace(os.sep, "/"), patterns):
+                affected.add(key)
+                break
+    return graph.closure(affected, reverse=True)
+
+
+# Cache export options that have no meaning when importing the cache
+CACHE_EXPORT_OPTIONS = [
+    "mode",
+    "compression",
+    "compression-level",
+    "force-compression",
+    "oci-mediatypes",
+    "image-manifest",
+    "ignore-error",
+]
 
-    # Now we have all the dependencies, regardless if they match the target
-    # Return only the dependencies that have the specified action (intersection)
-    return all_dependencies.intersection(action_targets)
+
+def parse_cache_spec(spec) -> dict:
+    """
+    Parse a `type=registry,ref=...` cache spec into a dict. A bare reference
+    is shorthand for a registry cache.
+    """
+    if "=" not in spec:
+        return {"type": "registry", "ref": spec}
+    return dict(option.partition("=")[::2] for option in spec.split(","))
+
+
+def format_cache_spec(options) -> str:
+    return ",".join(f"{key}={value}" for key, value in options.items())
+
+
+def cache_source(spec) -> str:
+    """
+    Return the spec that imports the cache written by a cache export spec
+    """
+    options = parse_cache_spec(spec)
+    if "dest" in options:
+        options["src"] = options.pop("dest")
+    for option in CACHE_EXPORT_OPTIONS:
+        options.pop(option, None)
+    return format_cache_spec(options)
+
+
+def default_cache_exports(image, cache_local=None, cache_registry=None):
+    """
+    Return the cache exports the global cache settings give an image: a
+    directory per image under cache_local and a `<name>:<tag>-cache` ref
+    under the cache_registry prefix, both exporting every layer
+    """
+    exports = []
+    if cache_local:
+        directory = re.sub(
+            r"[^A-Za-z0-9_.-]", "_", f"{image['name']}-{image['tag']}"
+        )
+        exports.append(
+            f"type=local,dest={os.path.join(cache_local, directory)},mode=max"
+        )
+    if cache_registry:
+        exports.append(
+            f"type=registry,ref={cache_registry}{image['name']}:"
+            f"{image['tag']}-cache,mode=max"
+        )
+    return exports
+
+
+def apply_build_caches(images_data, cache_local=None, cache_registry=None):
+    """
+    Fill in the cache_from and cache_to fields of every built image. Global
+    cache settings add to each image's own cache_to, and each image imports
+    the caches it exports plus those of its dependencies, so a cold builder
+    can reuse the layers of a changed image's base.
+    """
+    graph = get_image_graph(images_data)
+    built = graph.with_action("build")
+    for key in built:
+        image = graph.get(key)
+        exports = list(image.get("cache_to", []))
+        exports.extend(
+            default_cache_exports(image, cache_local, cache_registry)
+        )
+        if exports:
+            image["cache_to"] = exports
+    for key in built:
+        image = graph.get(key)
+        sources = list(image.get("cache_from", []))
+        for source in [key] + list(graph.dependencies(key)):
+            sources.extend(
+                cache_source(spec)
+                for spec in graph.get(source).get("cache_to", [])
+            )
+        if sources:
+            image["cache_from"] = list(dict.fromkeys(sources))
 
 
 def validate_images_dependencies(images):
     # Check that all dependencies are defined
-    image_names = [image["name"] for image in images]
-    image_names = [
+    image_names = {
         image["name"]
         for image in filter(
             lambda x: len({"pull", "build"}.intersection(set(x["actions"]))),
             images,
         )
-    ]
+    }
     for image in images:
         if "dependencies" in image:
             for dependency in image["dependencies"]:
@@ -198,4 +705,9 @@ def validate_images_dependencies(images):
                     raise ValueError(
                         f"Image {image['name']} has a dependency on {dependency['name']} which does not exist or has no pull or build action"
                     )
-    # TODO check for circular dependencies
+    cycle = get_image_graph(images).find_cycle()
+    if cycle:
+        raise ValueError(
+            "Circular dependency detected: "
+            + " → ".join(":".join(key) for key in cycle)
+        )
@@ -0,0 +1,283 @@
+import hashlib
+import os
+import re
+import tarfile
+import threading
+
+from wake_build.log import logger
+
+DOCKERIGNORE_FILE = ".dockerignore"
+# Directory under the cache dir holding packed shared contexts
+CONTEXTS_DIR = "contexts"
+
+
+def read_dockerignore(context):
+    """
+    Return the patterns from a context's .dockerignore as (regex, exclude)
+    tuples, in file order
+    """
+    try:
+        with open(os.path.join(context, DOCKERIGNORE_FILE), "r") as file:
+            lines = file.read().splitlines()
+    except FileNotFoundError:
+        return []
+    patterns = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        exclude = True
+        if line.startswith("!"):
+            exclude = False
+            line = line[1:].strip()
+        line = os.path.normpath(line).lstrip("/")
+        if line == ".":
+            continue
+        patterns.append((compile_pattern(line), exclude))
+    return patterns
+
+
+def compile_pattern(pattern):
+    """
+    Translate a .dockerignore pattern into a regex, where `*` and `?` do not
+    cross directory separators and `**` matches any number of directories
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**", i):
+            i += 2
+            if pattern.startswith("/", i):
+                # `**/` may also match no directories at all
+                regex += "(?:.*/)?"
+                i += 1
+            else:
+                regex += ".*"
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                group = pattern[i + 1 : end]
+                if group.startswith("^") or group.startswith("!"):
+                    group = "^" + group[1:]
+                regex += f"[{group}]"
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(char)
+        i += 1
+    return re.compile(regex)
+
+
+def is_ignored(path, patterns):
+    """
+    Return whether a context relative path is excluded. A pattern matches a
+    path if it matches the path itself or any of its parent directories, and
+    the last matching pattern wins.
+    """
+    parts = path.split("/")
+    prefixes = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+    ignored = False
+    for regex, exclude in patterns:
+        if any(regex.fullmatch(prefix) for prefix in prefixes):
+            ignored = exclude
+    return ignored
+
+
+def is_excluded(path, exclude):
+    """
+    Return whether path is one of the absolute paths in exclude or lies below
+    one of them
+    """
+    path = os.path.abspath(path)
+    return any(
+        path == excluded or path.startswith(excluded + os.sep)
+        for excluded in exclude
+    )
+
+
+def iter_context_files(context, patterns=None, exclude=()):
+    """
+    Yield the context relative paths of every directory and file that is not
+    excluded by .dockerignore, in a stable order. Anything at or below the
+    paths in exclude, such as wake's own cache and logs, is left out too.
+    """
+    if patterns is None:
+        patterns = read_dockerignore(context)
+    exclude = [os.path.abspath(excluded) for excluded in exclude]
+    # Excluded directories can only be skipped outright when no later
+    # pattern could re-include something inside them
+    can_prune = all(exclude for _, exclude in patterns)
+    for root, dirs, files in os.walk(context):
+        relative_root = os.path.relpath(root, context)
+        relative_root = "" if relative_root == "." else relative_root + "/"
+        kept_dirs = []
+        for name in sorted(dirs):
+            path = relative_root + name
+            if is_excluded(os.path.join(context, path), exclude):
+                continue
+            ignored = is_ignored(path, patterns)
+            if not ignored:
+                yield path
+            if not (ignored and can_prune):
+                kept_dirs.append(name)
+        dirs[:] = kept_dirs
+        for name in sorted(files):
+            path = relative_root + name
+            if is_excluded(os.path.join(context, path), exclude):
+                continue
+            if not is_ignored(path, patterns):
+                yield path
+
+
+class ChunkWriter:
+    """
+    Write-only file object that collects written data until it is drained
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def reset_owner(info):
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+def context_dockerfile(context, dockerfile=None):
+    """
+    Return the path of dockerfile relative to context, and whether it lies
+    outside of the context and so must be added to the archive separately
+    """
+    if dockerfile is None:
+        return "Dockerfile", False
+    relative = os.path.relpath(dockerfile, context)
+    if relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+        return ".wake.Dockerfile", True
+    return relative.replace(os.sep, "/"), False
+
+
+def stream_context(context, dockerfile=None, shared_dockerfiles=(), exclude=()):
+    """
+    Yield a tar archive of the build context as it is produced, honouring
+    .dockerignore and leaving out the paths in exclude. The dockerfile is always included, even when ignored or
+    outside of the context, as are shared_dockerfiles, those of other images
+    building from the same archive. Each file is yielded as soon as it is
+    archived, so memory use is bounded by the largest single file.
+    """
+    writer = ChunkWriter()
+    required = {}
+    for path in [dockerfile, *shared_dockerfiles]:
+        name, external = context_dockerfile(context, path)
+        if path is None:
+            path = os.path.join(context, name)
+        required[name] = (path, external)
+    with tarfile.open(
+        fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT
+    ) as tar:
+        for path in iter_context_files(context, exclude=exclude):
+            tar.add(
+                os.path.join(context, path),
+                arcname=path,
+                recursive=False,
+                filter=reset_owner,
+            )
+            if path in required and not required[path][1]:
+                del required[path]
+            yield from writer.drain()
+        for name, (source, _) in required.items():
+            if os.path.isfile(source):
+                tar.add(source, arcname=name, filter=reset_owner)
+    yield from writer.drain()
+
+
+class SharedContexts:
+    """
+    Archives of the build contexts shared by more than one image, each packed
+    once into directory on first use and fed to every build that shares it,
+    rather than walking and archiving the context again for each build.
+    The archives themselves and the paths in exclude are never packed.
+    """
+
+    def __init__(self, images, directory, exclude=()):
+        self.directory = directory
+        self.exclude = [directory, *exclude]
+        self.groups = {}
+        for image in images:
+            self.groups.setdefault(self.group_key(image), []).append(image)
+        self.archives = {}
+        self.locks = {key: threading.Lock() for key in self.groups}
+        self.lock = threading.Lock()
+        self.packed_bytes = 0
+        self.reused_bytes = 0
+
+    @staticmethod
+    def group_key(image):
+        # A dockerfile outside the context is added to the archive under a
+        # fixed name, so only images sharing it can share the archive
+        context = os.path.normpath(image.get("context", "."))
+        dockerfile = image.get("dockerfile")
+        _, external = context_dockerfile(context, dockerfile)
+        return context, os.path.normpath(dockerfile) if external else None
+
+    def archive(self, image):
+        """
+        Return the path of the context archive for an image, or None if no
+        other image shares its context
+        """
+        key = self.group_key(image)
+        images = self.groups.get(key, [])
+        if len(images) < 2:
+            return None
+        with self.locks[key]:
+            if key in self.archives:
+                path, size = self.archives[key]
+                with self.lock:
+                    self.reused_bytes += size
+                return path
+            context, _ = key
+            dockerfiles = [image.get("dockerfile") for image in images]
+            name = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+            path = os.path.join(self.directory, f"{name}.tar")
+            os.makedirs(self.directory, exist_ok=True)
+            size = 0
+            with open(path, "wb") as file:
+                for chunk in stream_context(
+                    context,
+                    dockerfiles[0],
+                    dockerfiles[1:],
+                    exclude=self.exclude,
+                ):
+                    file.write(chunk)
+                    size += len(chunk)
+            self.archives[key] = (path, size)
+            with self.lock:
+                self.packed_bytes += size
+            return path
+
+    def log_summary(self):
+        logger.info(
+            f"Shared contexts: packed {len(self.archives)} archives of "
+            f"{self.packed_bytes} bytes in total, saving {self.reused_bytes} "
+            "bytes of repeated packing"
+        )
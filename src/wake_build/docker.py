@@ -1,49 +1,239 @@
-from wake_build.util import run_command
+from wake_build.config import parse_cache_spec, platform_variants
+from wake_build.context import context_dockerfile
+from wake_build.executor import get_executor
+from wake_build.util import capture_command, get_output
+import json
 import os
 
 
-def build_image(config, dry_run=False, live_output=False) -> bool:
+def image_reference(config, prefix=""):
+    return f"{prefix}{config['name']}:{config['tag']}"
+
+
+def get_registry(reference):
+    """
+    Return the registry host an image reference resolves to, following the
+    docker convention that the first path component is a registry only if it
+    looks like a hostname
+    """
+    first, sep, _ = reference.partition("/")
+    if sep and ("." in first or ":" in first or first == "localhost"):
+        return first
+    return "docker.io"
+
+
+def get_build_args(config):
+    """
+    Return the build args for an image, with env_args resolved from the
+    environment
+    """
+    build_args = dict(config.get("build_args", {}))
+    for key in config.get("env_args", []):
+        build_args[key] = os.environ.get(key, "")
+    return build_args
+
+
+def get_cache_from(config):
+    """
+    Return the cache imports for an image, leaving out local directories
+    that have not been written yet so a first build works offline
+    """
+    sources = []
+    for spec in config.get("cache_from", []):
+        options = parse_cache_spec(spec)
+        if options.get("type") == "local" and not os.path.isdir(
+            options.get("src", "")
+        ):
+            continue
+        sources.append(spec)
+    return sources
+
+
+def engine_can_build(config):
+    """
+    Return whether the engine API can build an image as configured. Only the
+    CLI can export caches, import caches other than registry images, or
+    point dependencies at per-platform variants.
+    """
+    return (
+        "build_contexts" not in config
+        and not config.get("cache_to")
+        and all(
+            parse_cache_spec(spec).get("type") == "registry"
+            for spec in get_cache_from(config)
+        )
+    )
+
+
+def build_image(
+    config,
+    dry_run=False,
+    live_output=False,
+    client=None,
+    output=None,
+    executor=None,
+    context_archive=None,
+) -> bool:
+    """
+    Build an image from its context directory, or from context_archive, a
+    prepacked archive of the context, when given
+    """
+    if client is not None and not dry_run and engine_can_build(config):
+        return client.build(
+            image_reference(config),
+            context=config.get("context", "."),
+            dockerfile=config.get("dockerfile"),
+            target=config.get("target"),
+            platform=config.get("platform"),
+            build_args=get_build_args(config),
+            cache_from=[
+                parse_cache_spec(spec).get("ref")
+                for spec in get_cache_from(config)
+            ],
+            archive=context_archive,
+            output=get_output(output, live_output),
+        )
     cmd = [
         "docker",
         "build",
         "--tag",
-        f"{config['name']}:{config['tag']}",
+        image_reference(config),
     ]
     if "target" in config:
         cmd.extend(["--target", config["target"]])
-    if "dockerfile" in config:
+    if "platform" in config:
+        cmd.extend(["--platform", config["platform"]])
+    for name, source in config.get("build_contexts", {}).items():
+        cmd.extend(["--build-context", f"{name}={source}"])
+    if context_archive is not None:
+        dockerfile_name, _ = context_dockerfile(
+            config.get("context", "."), config.get("dockerfile")
+        )
+        cmd.extend(["--file", dockerfile_name])
+    elif "dockerfile" in config:
         cmd.extend(["--file", config["dockerfile"]])
-    if "build_args" in config:
-        for key, value in config["build_args"].items():
-            cmd.extend(["--build-arg", f"{key}={value}"])
-    if "env_args" in config:
-        for key in config["env_args"]:
-            cmd.extend(["--build-arg", f"{key}={os.environ.get(key, '')}"])
-    if "context" in config:
+    for key, value in get_build_args(config).items():
+        cmd.extend(["--build-arg", f"{key}={value}"])
+    for spec in get_cache_from(config):
+        cmd.extend(["--cache-from", spec])
+    for spec in config.get("cache_to", []):
+        cmd.extend(["--cache-to", spec])
+    if context_archive is not None:
+        cmd.append("-")
+    elif "context" in config:
         cmd.append(config["context"])
     else:
         cmd.append(".")
-    return run_command(cmd, dry_run=dry_run, live_output=live_output)
+    return get_executor(executor, dry_run).run(
+        cmd, live_output=live_output, output=output, stdin=context_archive
+    )
 
 
-def pull_image(config, dry_run=False, live_output=False) -> bool:
-    cmd = ["docker", "pull", f"{config['name']}:{config['tag']}"]
-    return run_command(cmd, dry_run=dry_run, live_output=live_output)
+def create_manifest(
+    config,
+    prefix="",
+    dry_run=False,
+    live_output=False,
+    client=None,
+    output=None,
+    executor=None,
+) -> bool:
+    """
+    Assemble the pushed per-platform variants of a multi-platform image into
+    a manifest list under the image's own reference. The engine API has no
+    equivalent, so this always goes through the CLI.
+    """
+    cmd = [
+        "docker",
+        "buildx",
+        "imagetools",
+        "create",
+        "--tag",
+        image_reference(config, prefix),
+    ]
+    for name, tag in platform_variants(config):
+        cmd.append(f"{prefix}{name}:{tag}")
+    return get_executor(executor, dry_run).run(
+        cmd, live_output=live_output, output=output
+    )
 
 
-def tag_image(config, prefix="", dry_run=False, live_output=False) -> bool:
+def pull_image(
+    config,
+    dry_run=False,
+    live_output=False,
+    client=None,
+    output=None,
+    executor=None,
+) -> bool:
+    if client is not None and not dry_run:
+        return client.pull(
+            image_reference(config), output=get_output(output, live_output)
+        )
+    cmd = ["docker", "pull", image_reference(config)]
+    return get_executor(executor, dry_run).run(
+        cmd, live_output=live_output, output=output
+    )
+
+
+def tag_image(
+    config,
+    prefix="",
+    dry_run=False,
+    live_output=False,
+    client=None,
+    output=None,
+    executor=None,
+) -> bool:
     if not prefix:
         # Skip tagging if no prefix is provided
         return True
+    if client is not None and not dry_run:
+        return client.tag(
+            image_reference(config), image_reference(config, prefix)
+        )
     cmd = [
         "docker",
         "tag",
-        f"{config['name']}:{config['tag']}",
-        f"{prefix}{config['name']}:{config['tag']}",
+        image_reference(config),
+        image_reference(config, prefix),
     ]
-    return run_command(cmd, dry_run=dry_run, live_output=live_output)
+    return get_executor(executor, dry_run).run(
+        cmd, live_output=live_output, output=output
+    )
+
+
+def push_image(
+    config,
+    prefix="",
+    dry_run=False,
+    live_output=False,
+    client=None,
+    output=None,
+    executor=None,
+) -> bool:
+    if client is not None and not dry_run:
+        return client.push(
+            image_reference(config, prefix),
+            output=get_output(output, live_output),
+        )
+    cmd = ["docker", "push", image_reference(config, prefix)]
+    return get_executor(executor, dry_run).run(
+        cmd, live_output=live_output, output=output
+    )
 
 
-def push_image(config, prefix="", dry_run=False, live_output=False) -> bool:
-    cmd = ["docker", "push", f"{prefix}{config['name']}:{config['tag']}"]
-    return run_command(cmd, dry_run=dry_run, live_output=live_output)
+def inspect_image(reference, client=None):
+    """
+    Return the local image metadata for a reference, or None if no such image
+    exists locally
+    """
+    if client is not None:
+        return client.inspect_image(reference)
+    output = capture_command(["docker", "image", "inspect", reference])
+    if output is None:
+        return None
+    try:
+        return json.loads(output)[0]
+    except (ValueError, IndexError):
+        return None
@@ -0,0 +1,332 @@
+import base64
+import http.client
+import json
+import os
+import queue
+import socket
+from urllib.parse import quote, urlencode, urlparse
+
+from wake_build.context import context_dockerfile, stream_context
+from wake_build.docker import get_registry
+from wake_build.log import logger
+from wake_build.report import run_report
+from wake_build.util import CommandOutput
+
+DEFAULT_DOCKER_HOST = "unix:///var/run/docker.sock"
+# Size of the chunks prepacked context archives are streamed in
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super(UnixHTTPConnection, self).__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class EngineAPIError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        super(EngineAPIError, self).__init__(
+            "Docker Engine API error %s: %s" % (status, message)
+        )
+
+
+def split_reference(reference):
+    """
+    Split an image reference into repository and tag, taking care not to
+    mistake a registry port for a tag
+    """
+    repository, sep, tag = reference.rpartition(":")
+    if not sep or "/" in tag:
+        return reference, "latest"
+    return repository, tag
+
+
+def read_archive(path):
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(ARCHIVE_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def load_registry_auths():
+    """
+    Return the basic auth entries from the docker CLI config, keyed by
+    registry. Credential helpers are not supported.
+    """
+    config_dir = os.environ.get(
+        "DOCKER_CONFIG", os.path.join(os.path.expanduser("~"), ".docker")
+    )
+    try:
+        with open(os.path.join(config_dir, "config.json"), "r") as file:
+            auths = json.load(file).get("auths", {})
+    except (FileNotFoundError, ValueError):
+        return {}
+    entries = {}
+    for server, entry in auths.items():
+        if "auth" not in entry:
+            continue
+        username, _, password = (
+            base64.b64decode(entry["auth"]).decode().partition(":")
+        )
+        registry = urlparse(server).netloc or server.split("/")[0]
+        if registry in ["index.docker.io", "registry-1.docker.io"]:
+            registry = "docker.io"
+        entries[registry] = {
+            "username": username,
+            "password": password,
+            "serveraddress": server,
+        }
+    return entries
+
+
+class EngineClient:
+    """
+    Minimal Docker Engine API client that keeps a pool of persistent
+    connections to the daemon, so each operation avoids both the CLI startup
+    cost and a new connection. Contexts are sent without the paths in
+    exclude, so wake's own cache and logs never reach the daemon.
+    """
+
+    def __init__(self, host=None, timeout=None, exclude=()):
+        host = host or os.environ.get("DOCKER_HOST") or DEFAULT_DOCKER_HOST
+        url = urlparse(host)
+        if url.scheme == "unix":
+            self.new_connection = lambda: UnixHTTPConnection(
+                url.path, timeout=timeout
+            )
+        elif url.scheme in ["tcp", "http"]:
+            self.new_connection = lambda: http.client.HTTPConnection(
+                url.hostname, url.port or 2375, timeout=timeout
+            )
+        else:
+            raise ValueError(f"Unsupported docker host: {host}")
+        self.pool = queue.LifoQueue()
+        self.auths = None
+        self.exclude = exclude
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def request(self, method, path, params=None, body=None, headers={}):
+        """
+        Send a request on a pooled connection and return the response along
+        with the connection, which must be handed back with release()
+        """
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        conn = None
+        # Streamed bodies cannot be replayed if a pooled connection turns out
+        # to have been closed by the daemon, so they get a fresh one
+        if body is None or isinstance(body, (bytes, str)):
+            try:
+                conn = self.pool.get_nowait()
+            except queue.Empty:
+                pass
+        pooled = conn is not None
+        if not pooled:
+            conn = self.new_connection()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            if not pooled:
+                raise
+            # The daemon may have closed an idle pooled connection
+            conn = self.new_connection()
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+
+    def release(self, conn, response):
+        if response.isclosed() and not response.will_close:
+            self.pool.put(conn)
+        else:
+            conn.close()
+
+    def call(self, method, path, params=None, body=None, headers={}):
+        """
+        Make a request and return the status and decoded JSON body, if any
+        """
+        conn, response = self.request(method, path, params, body, headers)
+        data = response.read()
+        self.release(conn, response)
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, data.decode(errors="replace")
+
+    def stream(self, method, path, params=None, body=None, headers={}):
+        """
+        Make a request whose response is a stream of JSON progress messages
+        and yield each message as it arrives
+        """
+        conn, response = self.request(method, path, params, body, headers)
+        try:
+            if response.status >= 300:
+                data = response.read()
+                try:
+                    message = json.loads(data).get("message", data)
+                except ValueError:
+                    message = data.decode(errors="replace")
+                raise EngineAPIError(response.status, message)
+            decoder = json.JSONDecoder()
+            buffer = ""
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                buffer += line.decode(errors="replace")
+                while buffer.strip():
+                    try:
+                        message, end = decoder.raw_decode(buffer.lstrip())
+                    except ValueError:
+                        break
+                    buffer = buffer.lstrip()[end:]
+                    yield message
+        finally:
+            if not response.isclosed():
+                response.read()
+            self.release(conn, response)
+
+    def run_stream(self, description, messages, output=None):
+        """
+        Consume a progress stream, returning whether it completed without an
+        error message. The tail of the output is written out on failure.
+        """
+        if output is None:
+            output = CommandOutput()
+        output.start([description])
+        start = run_report.now()
+        success = False
+        try:
+            for message in messages:
+                text = message.get("stream") or message.get("status")
+                if text:
+                    if message.get("id"):
+                        text = f"{message['id']}: {text}"
+                    output.write(text)
+                if "error" in message:
+                    logger.error(f"{description} failed: {message['error']}")
+                    output.dump_tail()
+                    return False
+            success = True
+        except (EngineAPIError, http.client.HTTPException, OSError) as e:
+            logger.error(f"{description} failed: {e}")
+        finally:
+            output.close()
+            run_report.record_command(
+                output.name,
+                [description],
+                start,
+                run_report.now(),
+                0 if success else 1,
+            )
+        return success
+
+    def registry_auth(self, reference):
+        if self.auths is None:
+            self.auths = load_registry_auths()
+        auth = self.auths.get(get_registry(reference), {})
+        encoded = base64.urlsafe_b64encode(json.dumps(auth).encode())
+        return {"X-Registry-Auth": encoded.decode()}
+
+    def build(
+        self,
+        reference,
+        context=".",
+        dockerfile=None,
+        target=None,
+        platform=None,
+        build_args={},
+        cache_from=(),
+        archive=None,
+        output=None,
+    ) -> bool:
+        params = {"t": reference, "rm": "1"}
+        params["dockerfile"] = context_dockerfile(context, dockerfile)[0]
+        if target:
+            params["target"] = target
+        if platform:
+            params["platform"] = platform
+        if build_args:
+            params["buildargs"] = json.dumps(build_args)
+        if cache_from:
+            # The build endpoint only imports caches from images
+            params["cachefrom"] = json.dumps(list(cache_from))
+        return self.run_stream(
+            f"Build of {reference}",
+            self.stream(
+                "POST",
+                "/build",
+                params,
+                body=(
+                    read_archive(archive)
+                    if archive is not None
+                    else stream_context(
+                        context, dockerfile, exclude=self.exclude
+                    )
+                ),
+                headers={"Content-Type": "application/x-tar"},
+            ),
+            output=output,
+        )
+
+    def pull(self, reference, output=None) -> bool:
+        repository, tag = split_reference(reference)
+        return self.run_stream(
+            f"Pull of {reference}",
+            self.stream(
+                "POST",
+                "/images/create",
+                {"fromImage": repository, "tag": tag},
+                headers=self.registry_auth(reference),
+            ),
+            output=output,
+        )
+
+    def push(self, reference, output=None) -> bool:
+        repository, tag = split_reference(reference)
+        return self.run_stream(
+            f"Push of {reference}",
+            self.stream(
+                "POST",
+                f"/images/{quote(repository, safe='/:')}/push",
+                {"tag": tag},
+                headers=self.registry_auth(reference),
+            ),
+            output=output,
+        )
+
+    def tag(self, source, reference) -> bool:
+        repository, tag = split_reference(reference)
+        status, data = self.call(
+            "POST",
+            f"/images/{quote(source, safe='/:')}/tag",
+            {"repo": repository, "tag": tag},
+        )
+        if status >= 300:
+            logger.error(f"Tag of {source} as {reference} failed: {data}")
+            return False
+        return True
+
+    def inspect_image(self, reference):
+        status, data = self.call(
+            "GET", f"/images/{quote(reference, safe='/:')}/json"
+        )
+        if status != 200:
+            return None
+        return data
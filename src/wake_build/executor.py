@@ -0,0 +1,211 @@
+import json
+import shlex
+import threading
+from abc import ABC, abstractmethod
+
+from wake_build.log import logger
+from wake_build.report import run_report
+from wake_build.util import get_output, run_command, terminate_commands
+
+
+def describe_command(command):
+    """
+    Return the action and image reference a docker command operates on, such
+    as ("build", "app:1.0") for `docker build --tag app:1.0 .`
+    """
+    args = command[1:]
+    # Skip global options such as --context that select the daemon
+    while args[0].startswith("--"):
+        args = args[2:]
+    if args[0] == "buildx":
+        args = args[1:]
+    action = args[0]
+    if action == "build":
+        return action, args[args.index("--tag") + 1]
+    if action == "bake":
+        return action, ""
+    if action == "tag":
+        return action, args[-2]
+    if action == "imagetools":
+        return "manifest", args[args.index("--tag") + 1]
+    return action, args[-1]
+
+
+class CommandExecutor(ABC):
+    """
+    Runs the docker commands issued for each step, returning whether they
+    succeeded. Whether the steps touch anything, and how, is up to the
+    executor.
+    """
+
+    # Whether commands act on the local docker daemon
+    real = True
+
+    @abstractmethod
+    def run(self, command, live_output=False, output=None, stdin=None) -> bool:
+        """
+        Run a command, feeding it the file at stdin if given, and return
+        whether it succeeded
+        """
+
+    def cancel(self):
+        """
+        Stop the commands currently running, making them fail
+        """
+        terminate_commands()
+
+    def transfer(
+        self,
+        reference,
+        source_args,
+        target_args,
+        live_output=False,
+        output=None,
+    ) -> bool:
+        """
+        Copy an image between daemons, each selected by docker global
+        options such as `--context name`, by piping `docker save` into
+        `docker load`
+        """
+        save = ["docker", *source_args, "save", reference]
+        load = ["docker", *target_args, "load"]
+        pipeline = " | ".join(
+            " ".join(shlex.quote(arg) for arg in command)
+            for command in [save, load]
+        )
+        return self.run(
+            ["sh", "-c", pipeline], live_output=live_output, output=output
+        )
+
+
+class CliExecutor(CommandExecutor):
+    def run(self, command, live_output=False, output=None, stdin=None) -> bool:
+        return run_command(
+            command, live_output=live_output, output=output, stdin=stdin
+        )
+
+
+class DryRunExecutor(CommandExecutor):
+    real = False
+
+    def run(self, command, live_output=False, output=None, stdin=None) -> bool:
+        if stdin is not None:
+            command = [*command, "<", stdin]
+        return run_command(command, dry_run=True)
+
+
+class SimulatedExecutor(CommandExecutor):
+    """
+    Sleeps instead of running each command, for a duration looked up by
+    `action reference` (e.g. `build app:1.0`), then by reference, then
+    falling back to default_duration. Commands whose key or reference is in
+    failures fail. Every call is recorded, along with the most commands that
+    ran at once, so scheduling can be measured without a docker daemon.
+    """
+
+    real = False
+
+    def __init__(self, durations=None, failures=(), default_duration=0.0):
+        self.durations = dict(durations or {})
+        self.failures = set(failures)
+        self.default_duration = default_duration
+        self.lock = threading.Lock()
+        self.cancelled = threading.Condition(self.lock)
+        self.generation = 0
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load a simulation from a JSON file with optional `durations`,
+        `failures` and `default_duration` fields
+        """
+        with open(path, "r") as file:
+            data = json.load(file)
+        return cls(
+            durations=data.get("durations"),
+            failures=data.get("failures", []),
+            default_duration=data.get("default_duration", 0.0),
+        )
+
+    def cancel(self):
+        with self.cancelled:
+            self.generation += 1
+            self.cancelled.notify_all()
+
+    def lookup(self, action, reference):
+        key = f"{action} {reference}".strip()
+        duration = self.durations.get(
+            key, self.durations.get(reference, self.default_duration)
+        )
+        return duration, key in self.failures or reference in self.failures
+
+    def run(self, command, live_output=False, output=None, stdin=None) -> bool:
+        action, reference = describe_command(command)
+        return self.simulate(command, action, reference, live_output, output)
+
+    def transfer(
+        self,
+        reference,
+        source_args,
+        target_args,
+        live_output=False,
+        output=None,
+    ) -> bool:
+        command = ["docker", *source_args, "save", reference]
+        return self.simulate(
+            command, "transfer", reference, live_output, output
+        )
+
+    def simulate(self, command, action, reference, live_output, output):
+        logger.info(f"Simulating command: `{' '.join(command)}`")
+        duration, fail = self.lookup(action, reference)
+        output = get_output(output, live_output)
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            generation = self.generation
+        start = run_report.now()
+        try:
+            output.start(command)
+            with self.cancelled:
+                self.cancelled.wait_for(
+                    lambda: self.generation != generation, timeout=duration
+                )
+                if self.generation != generation:
+                    fail = True
+            output.write(f"Simulated {action} of {reference} in {duration}s")
+            output.close()
+        finally:
+            end = run_report.now()
+            with self.lock:
+                self.running -= 1
+                self.calls.append(
+                    {
+                        "command": command,
+                        "action": action,
+                        "reference": reference,
+                        "start": start,
+                        "end": end,
+                        "success": not fail,
+                    }
+                )
+            run_report.record_command(
+                output.name, command, start, end, 1 if fail else 0
+            )
+        if fail:
+            logger.error(f"Simulated failure of `{' '.join(command)}`")
+            output.dump_tail()
+        return not fail
+
+
+def get_executor(executor=None, dry_run=False):
+    """
+    Return the executor to run commands with, defaulting to the docker CLI
+    or, for dry runs, to logging the commands
+    """
+    if executor is not None:
+        return executor
+    return DryRunExecutor() if dry_run else CliExecutor()
@@ -0,0 +1,143 @@
+import heapq
+import json
+import os
+import threading
+
+HISTORY_FILE = "history.json"
+DEFAULT_DURATION = 1.0
+# Weight of the latest run in the moving average of each step's duration
+SMOOTHING = 0.5
+
+
+class BuildHistory:
+    """
+    Moving average of how long each step took in previous runs, keyed by
+    step name such as `build app:1.0`. A read only history, as used for dry
+    runs, still provides estimates but ignores new durations.
+    """
+
+    def __init__(self, cache_dir, read_only=False):
+        self.path = os.path.join(cache_dir, HISTORY_FILE)
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.dirty = False
+        # Average duration of the known steps of each action, computed on
+        # first use rather than per estimate
+        self.averages = None
+        try:
+            with open(self.path, "r") as file:
+                self.durations = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.durations = {}
+
+    def record(self, name, duration):
+        if self.read_only:
+            return
+        with self.lock:
+            previous = self.durations.get(name)
+            if previous is not None:
+                duration = SMOOTHING * duration + (1 - SMOOTHING) * previous
+            self.durations[name] = duration
+            self.dirty = True
+            self.averages = None
+
+    def estimate(self, name):
+        """
+        Return the expected duration of a step, falling back to the average
+        of known steps with the same action, then to DEFAULT_DURATION
+        """
+        with self.lock:
+            if name in self.durations:
+                return self.durations[name]
+            if self.averages is None:
+                totals = {}
+                for known, duration in self.durations.items():
+                    total = totals.setdefault(known.split(" ", 1)[0], [0, 0])
+                    total[0] += duration
+                    total[1] += 1
+                self.averages = {
+                    action: total / count
+                    for action, (total, count) in totals.items()
+                }
+            return self.averages.get(name.split(" ", 1)[0], DEFAULT_DURATION)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self.durations, file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+
+def upward_ranks(dependencies, durations):
+    """
+    Return the length of the longest path from each node to the end of the
+    graph, including the node itself (the HEFT upward rank). Starting nodes
+    with the highest rank first keeps long chains from starting late.
+    """
+    dependents = {node: [] for node in dependencies}
+    for node, deps in dependencies.items():
+        for dep in deps:
+            if dep in dependents:
+                dependents[dep].append(node)
+    # Visit nodes in reverse topological order, so dependents come first
+    remaining = {node: len(dependents[node]) for node in dependencies}
+    stack = [node for node, count in remaining.items() if not count]
+    ranks = {}
+    while stack:
+        node = stack.pop()
+        ranks[node] = durations[node] + max(
+            (ranks[dependent] for dependent in dependents[node]), default=0
+        )
+        for dep in dependencies[node]:
+            if dep in remaining:
+                remaining[dep] -= 1
+                if not remaining[dep]:
+                    stack.append(dep)
+    return ranks
+
+
+def simulate_schedule(dependencies, durations, jobs=1, priority=None):
+    """
+    Predict the schedule the scheduler would produce with `jobs` slots,
+    assuming each node takes its estimated duration. Returns a list of
+    (start, end, slot, node) tuples ordered by start time.
+    """
+    if priority is None:
+        priority = upward_ranks(dependencies, durations)
+    waiting_on = {
+        node: sum(1 for dep in deps if dep in dependencies)
+        for node, deps in dependencies.items()
+    }
+    dependents = {node: [] for node in dependencies}
+    for node, deps in dependencies.items():
+        for dep in deps:
+            if dep in dependents:
+                dependents[dep].append(node)
+    ready = [node for node, count in waiting_on.items() if not count]
+    free_slots = list(range(max(1, jobs)))
+    running = []
+    schedule = []
+    now = 0.0
+    while ready or running:
+        ready.sort(key=lambda node: -priority.get(node, 0))
+        while ready and free_slots:
+            node = ready.pop(0)
+            slot = free_slots.pop(0)
+            end = now + durations[node]
+            heapq.heappush(running, (end, len(schedule), slot, node))
+            schedule.append((now, end, slot, node))
+        if not running:
+            break
+        now, _, slot, node = heapq.heappop(running)
+        free_slots.append(slot)
+        free_slots.sort()
+        for dependent in dependents[node]:
+            waiting_on[dependent] -= 1
+            if not waiting_on[dependent]:
+                ready.append(dependent)
+    return schedule
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from wake_build.cache import Fingerprinter
+from wake_build.docker import image_reference, inspect_image
+from wake_build.log import logger
+
+JOURNAL_FILE = "journal.jsonl"
+
+
+class RunJournal:
+    """
+    Append-only record of the steps completed during a run, each with the
+    fingerprint of its inputs, so an interrupted or failed run can be
+    resumed. A new run starts a new journal; a resumed run keeps it and
+    skips steps recorded with the same inputs whose output still exists.
+    Pushes and signatures record the digests docker saved for the local
+    image, and a resumed run checks the digest the registry now serves,
+    looked up with resolve_digest, is still one of them.
+    """
+
+    def __init__(
+        self,
+        images_data,
+        cache_dir,
+        resume=False,
+        client=None,
+        resolve_digest=None,
+        exclude=(),
+    ):
+        self.path = os.path.join(cache_dir, JOURNAL_FILE)
+        self.client = client
+        self.resolve_digest = resolve_digest
+        # Shared with the build cache, so each context is hashed once
+        self.fingerprinter = Fingerprinter(
+            images_data, exclude=[cache_dir, *exclude], client=client
+        )
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.resumed = 0
+        if resume:
+            self.entries = self.read()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.file = open(self.path, "a" if resume else "w")
+
+    def read(self):
+        entries = {}
+        try:
+            with open(self.path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line is cut short if the run was killed
+                        continue
+                    entries[entry["step"]] = entry
+        except FileNotFoundError:
+            logger.warning("No journal to resume from, starting afresh")
+        return entries
+
+    def step_reference(self, action, image, prefix=""):
+        if action in ["tag", "push", "sign"]:
+            return image_reference(image, prefix)
+        return image_reference(image)
+
+    def fingerprint(self, action, image, prefix="", info=None):
+        """
+        Fingerprint the inputs of a step: everything a build depends on, or
+        the local image a tag or push started from, given as info if it was
+        already inspected. Pulls and signatures have no local inputs and are
+        checked through their outputs alone.
+        """
+        inputs = None
+        if action == "build":
+            inputs = self.fingerprinter.fingerprint(
+                (image["name"], image["tag"])
+            )
+        elif action in ["tag", "push"]:
+            if info is None:
+                info = inspect_image(image_reference(image), client=self.client)
+            inputs = info["Id"] if info else None
+        encoded = json.dumps(
+            [action, self.step_reference(action, image, prefix), inputs]
+        ).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def output_exists(self, action, image, prefix, entry):
+        """
+        Return whether the output of a completed step is still there: the
+        local image for builds, pulls and tags, and the same manifest in
+        the registry for pushes and signatures
+        """
+        reference = self.step_reference(action, image, prefix)
+        if action in ["push", "sign"]:
+            if self.resolve_digest is None:
+                return False
+            digest = self.resolve_digest(reference)
+            return digest is not None and digest in entry.get("digests", [])
+        return inspect_image(reference, client=self.client) is not None
+
+    def is_done(self, action, image, prefix=""):
+        step = f"{action} {self.step_reference(action, image, prefix)}"
+        with self.lock:
+            entry = self.entries.get(step)
+        if entry is None:
+            return False
+        done = entry["fingerprint"] == self.fingerprint(
+            action, image, prefix
+        ) and self.output_exists(action, image, prefix, entry)
+        if done:
+            with self.lock:
+                self.resumed += 1
+        return done
+
+    def record(self, action, image, prefix=""):
+        reference = self.step_reference(action, image, prefix)
+        step = f"{action} {reference}"
+        info = None
+        digests = []
+        if action in ["tag", "push", "sign"]:
+            # Tags and pushes leave the reference on the image they started
+            # from, so one local inspect gives both their input and the
+            # digests of what was pushed, without asking the registry
+            info = inspect_image(reference, client=self.client)
+        if action in ["push", "sign"] and info:
+            from wake_build.registry import local_digests
+
+            digests = sorted(local_digests(reference, info=info))
+        entry = {
+            "step": step,
+            "fingerprint": self.fingerprint(action, image, prefix, info=info),
+            "digests": digests,
+            "time": time.time(),
+        }
+        with self.lock:
+            self.entries[step] = entry
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def log_summary(self):
+        if self.resumed:
+            logger.info(
+                f"Journal: {self.resumed} steps done in the resumed run"
+            )
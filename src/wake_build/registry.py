@@ -0,0 +1,174 @@
+import base64
+import json
+import re
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from wake_build.docker import get_registry, inspect_image
+from wake_build.engine import load_registry_auths, split_reference
+from wake_build.log import logger
+
+MANIFEST_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+DOCKER_HUB_API = "registry-1.docker.io"
+
+
+def parse_reference(reference):
+    """
+    Split an image reference into registry, repository path and tag, using
+    the same defaults as the docker CLI
+    """
+    repository, tag = split_reference(reference)
+    registry = get_registry(repository)
+    if repository.startswith(registry + "/"):
+        path = repository[len(registry) + 1 :]
+    else:
+        path = repository
+    if registry == "docker.io" and "/" not in path:
+        path = f"library/{path}"
+    return registry, path, tag
+
+
+def parse_challenge(header):
+    """
+    Parse a `WWW-Authenticate: Bearer key="value",...` header into a dict
+    """
+    scheme, _, params = header.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+class RegistryClient:
+    """
+    Looks up the manifest digest a tag points to through the registry HTTP
+    API, following the bearer token flow when the registry requires it
+    """
+
+    def __init__(self, insecure_registries=(), auths=None, timeout=30):
+        self.insecure_registries = set(insecure_registries)
+        self.auths = auths
+        self.timeout = timeout
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def base_url(self, registry):
+        host = DOCKER_HUB_API if registry == "docker.io" else registry
+        local = host.split(":")[0] in ["localhost", "127.0.0.1"]
+        insecure = local or registry in self.insecure_registries
+        return f"{'http' if insecure else 'https'}://{host}"
+
+    def credentials(self, registry):
+        with self.lock:
+            if self.auths is None:
+                self.auths = load_registry_auths()
+            return self.auths.get(registry)
+
+    def fetch_token(self, registry, challenge):
+        params = {
+            key: challenge[key]
+            for key in ["service", "scope"]
+            if key in challenge
+        }
+        request = urllib.request.Request(
+            f"{challenge['realm']}?{urlencode(params)}"
+        )
+        auth = self.credentials(registry)
+        if auth:
+            basic = f"{auth['username']}:{auth['password']}".encode()
+            request.add_header(
+                "Authorization", f"Basic {base64.b64encode(basic).decode()}"
+            )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)
+        return data.get("token") or data.get("access_token")
+
+    def head_manifest(self, registry, path, tag, token=None):
+        request = urllib.request.Request(
+            f"{self.base_url(registry)}/v2/{path}/manifests/{tag}",
+            method="HEAD",
+        )
+        request.add_header("Accept", ", ".join(MANIFEST_TYPES))
+        if token:
+            request.add_header("Authorization", f"Bearer {token}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.headers.get("Docker-Content-Digest")
+
+    def get_digest(self, reference):
+        """
+        Return the digest of the manifest the reference points to in its
+        registry, or None if it does not exist or cannot be looked up
+        """
+        registry, path, tag = parse_reference(reference)
+        token = self.tokens.get((registry, path))
+        try:
+            try:
+                return self.head_manifest(registry, path, tag, token)
+            except urllib.error.HTTPError as e:
+                challenge = parse_challenge(
+                    e.headers.get("WWW-Authenticate", "")
+                )
+                if e.code != 401 or not challenge:
+                    raise
+            token = self.fetch_token(registry, challenge)
+            self.tokens[(registry, path)] = token
+            return self.head_manifest(registry, path, tag, token)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.debug(f"Unable to look up digest of {reference}: {e}")
+            return None
+
+
+def local_digests(reference, client=None, info=None):
+    """
+    Return the registry digests recorded for the repository of a local image,
+    from the digests docker saved when it was last pulled or pushed. info is
+    the image's metadata, if it was already inspected.
+    """
+    if info is None:
+        info = inspect_image(reference, client=client)
+    if not info:
+        return set()
+    registry, path, _ = parse_reference(reference)
+    digests = set()
+    for repo_digest in info.get("RepoDigests") or []:
+        repository, _, digest = repo_digest.partition("@")
+        if parse_reference(repository)[:2] == (registry, path):
+            digests.add(digest)
+    return digests
+
+
+class DigestChecker:
+    """
+    Decides whether a pull or push would transfer anything, by comparing the
+    digest in the registry with the digests known for the local image
+    """
+
+    def __init__(self, registry_client, client=None):
+        self.registry_client = registry_client
+        self.client = client
+        self.checked = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def is_current(self, reference):
+        remote = self.registry_client.get_digest(reference)
+        current = remote is not None and remote in local_digests(
+            reference, client=self.client
+        )
+        with self.lock:
+            self.checked += 1
+            if current:
+                self.skipped += 1
+        return current
+
+    def log_summary(self):
+        logger.info(
+            f"Digest check: skipped {self.skipped} of {self.checked} "
+            "transfers already up to date"
+        )
@@ -0,0 +1,172 @@
+import contextlib
+import json
+import threading
+import time
+
+
+class RunReport:
+    """
+    Collects timings for phases, scheduled tasks and the commands they run.
+    All times are seconds relative to when the report was started.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.phases = []
+        self.tasks = []
+        self.commands = []
+
+    def now(self):
+        return time.time() - self.started
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = self.now()
+        try:
+            yield
+        finally:
+            end = self.now()
+            with self.lock:
+                self.phases.append(
+                    {
+                        "name": name,
+                        "start": start,
+                        "end": end,
+                        "duration": end - start,
+                    }
+                )
+
+    def record_task(
+        self, name, outcome, queued, start, end, dependencies=(), worker=None
+    ):
+        """
+        Record a scheduled task. queued is when it became ready to run, so
+        start - queued is the time it waited for a free slot.
+        """
+        with self.lock:
+            self.tasks.append(
+                {
+                    "name": name,
+                    "outcome": outcome,
+                    "queued": queued,
+                    "start": start,
+                    "end": end,
+                    "duration": end - start,
+                    "queue_wait": start - queued,
+                    "dependencies": list(dependencies),
+                    "worker": worker,
+                }
+            )
+
+    def record_command(self, name, command, start, end, returncode):
+        with self.lock:
+            self.commands.append(
+                {
+                    "name": name,
+                    "command": command,
+                    "start": start,
+                    "end": end,
+                    "duration": end - start,
+                    "returncode": returncode,
+                }
+            )
+
+    def critical_path(self):
+        """
+        Return the chain of tasks that gated the end of the run, found by
+        walking back from the last task to finish through whichever of its
+        dependencies finished last
+        """
+        tasks = {task["name"]: task for task in self.tasks}
+        if not tasks:
+            return []
+        task = max(tasks.values(), key=lambda task: task["end"])
+        path = [task]
+        while True:
+            dependencies = [
+                tasks[dep] for dep in task["dependencies"] if dep in tasks
+            ]
+            if not dependencies:
+                break
+            task = max(dependencies, key=lambda task: task["end"])
+            path.append(task)
+        path.reverse()
+        return path
+
+    def to_dict(self):
+        with self.lock:
+            path = self.critical_path()
+            return {
+                "started": self.started,
+                "duration": self.now(),
+                "phases": list(self.phases),
+                "tasks": sorted(self.tasks, key=lambda task: task["start"]),
+                "commands": list(self.commands),
+                "critical_path": {
+                    "tasks": [task["name"] for task in path],
+                    "duration": (
+                        path[-1]["end"] - path[0]["start"] if path else 0
+                    ),
+                },
+            }
+
+    def trace_events(self):
+        """
+        Return the report as Chrome trace events, with one track per worker
+        thread and one for phases
+        """
+        events = []
+        workers = {}
+        with self.lock:
+            for phase in self.phases:
+                events.append(
+                    {
+                        "name": phase["name"],
+                        "cat": "phase",
+                        "ph": "X",
+                        "ts": phase["start"] * 1e6,
+                        "dur": phase["duration"] * 1e6,
+                        "pid": 1,
+                        "tid": 0,
+                    }
+                )
+            for task in self.tasks:
+                tid = workers.setdefault(task["worker"], len(workers) + 1)
+                events.append(
+                    {
+                        "name": task["name"],
+                        "cat": task["outcome"],
+                        "ph": "X",
+                        "ts": task["start"] * 1e6,
+                        "dur": task["duration"] * 1e6,
+                        "pid": 1,
+                        "tid": tid,
+                        "args": {"queue_wait": task["queue_wait"]},
+                    }
+                )
+        for worker, tid in workers.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": 1,
+                    "tid": tid,
+                    "args": {"name": str(worker)},
+                }
+            )
+        return events
+
+    def write_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_trace(self, path):
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events()}, file)
+
+
+run_report = RunReport()
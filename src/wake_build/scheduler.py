@@ -0,0 +1,225 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from wake_build.log import logger
+
+SUCCESS = "success"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def run_graph(
+    nodes,
+    dependencies,
+    func,
+    jobs=1,
+    keep_going=False,
+    on_complete=None,
+    limit_key=None,
+    limit=None,
+    report=None,
+    describe=str,
+    priority=None,
+    demand=None,
+    capacity=None,
+) -> dict:
+    """
+    Run func(node) for every node once all of its dependencies have succeeded,
+    keeping up to `jobs` calls in flight at once.
+
+    `dependencies` maps a node to the nodes it waits on; dependencies that are
+    not themselves in `nodes` are considered already satisfied. `func` returns
+    a truthy value on success. On the first failure no further nodes are
+    started unless `keep_going` is set, in which case only the dependents of
+    the failed node are skipped, and reported to `on_complete` like the
+    nodes that ran. If `limit_key` and `limit` are given, at most `limit`
+    nodes sharing the same limit_key(node) run at the same time;
+    nodes whose key is None are not limited. Each node's queue wait and run
+    time are recorded in `report` when given, named with describe(node).
+    Ready nodes with a higher `priority` value are started first. If
+    `demand` and `capacity` are given, demand(node) is a tuple of the amount
+    of each resource the node needs and capacity the total available (None
+    for no limit), and a node only starts while its demand fits next to
+    those of the running nodes. The demand of the highest priority node that
+    does not fit yet is held back, and lower priority nodes only start in
+    the capacity left over, so they cannot delay it indefinitely. A node
+    needing more than the whole capacity runs once nothing else is.
+    Returns a dict mapping every node to one of SUCCESS, FAILED or SKIPPED.
+    """
+    nodes = list(nodes)
+    node_set = set(nodes)
+    waiting_on = {}
+    dependents = {node: [] for node in nodes}
+    for node in nodes:
+        deps = set(dependencies.get(node, ())) & node_set
+        waiting_on[node] = len(deps)
+        for dep in deps:
+            dependents[dep].append(node)
+
+    outcomes = {}
+    # Heap of (-priority, sequence, node), so ready nodes start by priority
+    # and then in the order they became ready
+    ready = []
+    sequence = itertools.count()
+    queued = {}
+
+    def add_ready(node):
+        rank = priority.get(node, 0) if priority is not None else 0
+        heapq.heappush(ready, (-rank, next(sequence), node))
+        queued[node] = time.time()
+
+    for node in nodes:
+        if not waiting_on[node]:
+            add_ready(node)
+    timings = {}
+
+    def timed(node):
+        start = time.time()
+        try:
+            return func(node)
+        finally:
+            timings[node] = (start, time.time(), threading.current_thread())
+
+    running = {}
+    running_keys = {}
+    limited = demand is not None and capacity is not None
+    in_use = [0] * len(capacity) if limited else []
+    stopped = False
+
+    def fits(node, reserved):
+        if not limited or not running:
+            return True
+        return all(
+            total is None or used + held + amount <= total
+            for used, held, amount, total in zip(
+                in_use, reserved, demand(node), capacity
+            )
+        )
+
+    def reserve(node, sign):
+        if limited:
+            for i, amount in enumerate(demand(node)):
+                in_use[i] += sign * amount
+
+    def at_limit(node):
+        if limit_key is None or limit is None:
+            return False
+        key = limit_key(node)
+        return key is not None and running_keys.get(key, 0) >= limit
+
+    def next_ready():
+        passed = []
+        found = None
+        # Capacity held back for the first node that does not fit
+        reserved = [0] * len(in_use)
+        blocked = False
+        while ready:
+            entry = heapq.heappop(ready)
+            node = entry[2]
+            if not at_limit(node):
+                if fits(node, reserved):
+                    found = node
+                    break
+                if not blocked:
+                    reserved = list(demand(node))
+                    blocked = True
+            passed.append(entry)
+        for entry in passed:
+            heapq.heappush(ready, entry)
+        return found
+
+    def skip_dependents(node):
+        stack = list(dependents[node])
+        while stack:
+            dependent = stack.pop()
+            if dependent in outcomes:
+                continue
+            outcomes[dependent] = SKIPPED
+            if on_complete is not None:
+                on_complete(dependent, SKIPPED)
+            stack.extend(dependents[dependent])
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while ready or running:
+            while ready and not stopped and len(running) < max(1, jobs):
+                node = next_ready()
+                if node is None:
+                    break
+                if limit_key is not None:
+                    key = limit_key(node)
+                    running_keys[key] = running_keys.get(key, 0) + 1
+                reserve(node, 1)
+                running[pool.submit(timed, node)] = node
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                if limit_key is not None:
+                    running_keys[limit_key(node)] -= 1
+                reserve(node, -1)
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.error(f"Unexpected error running {node}: {e}")
+                    success = False
+                if success:
+                    outcomes[node] = SUCCESS
+                    for dependent in dependents[node]:
+                        waiting_on[dependent] -= 1
+                        if not waiting_on[dependent] and (
+                            dependent not in outcomes
+                        ):
+                            add_ready(dependent)
+                else:
+                    outcomes[node] = FAILED
+                    skip_dependents(node)
+                    if not keep_going:
+                        stopped = True
+                if report is not None:
+                    start, end, thread = timings[node]
+                    report.record_task(
+                        describe(node),
+                        outcomes[node],
+                        queued[node] - report.started,
+                        start - report.started,
+                        end - report.started,
+                        dependencies=[
+                            describe(dep)
+                            for dep in dependencies.get(node, ())
+                            if dep in node_set
+                        ],
+                        worker=thread.name,
+                    )
+                if on_complete is not None:
+                    on_complete(node, outcomes[node])
+
+    for node in nodes:
+        outcomes.setdefault(node, SKIPPED)
+    return outcomes
+
+
+def log_outcomes(outcomes, describe=str):
+    """
+    Log the outcome of every node from a run_graph call followed by totals.
+    Failed and skipped nodes are logged as errors, successes as info.
+    """
+    counts = {SUCCESS: 0, FAILED: 0, SKIPPED: 0}
+    for node in sorted(outcomes, key=describe):
+        outcome = outcomes[node]
+        counts[outcome] += 1
+        if outcome == SUCCESS:
+            logger.info(f"{describe(node)}: {outcome}")
+        else:
+            logger.error(f"{describe(node)}: {outcome}")
+    summary = (
+        f"{counts[SUCCESS]} succeeded, {counts[FAILED]} failed, "
+        f"{counts[SKIPPED]} skipped"
+    )
+    if counts[FAILED] or counts[SKIPPED]:
+        logger.error(summary)
+    else:
+        logger.info(summary)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+
+from wake_build.engine import split_reference
+from wake_build.executor import get_executor
+from wake_build.log import logger
+
+
+class SignBatch:
+    def __init__(self):
+        self.references = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.success = False
+
+
+class Signer(ABC):
+    """
+    Signs pushed images by digest. Concurrent calls to sign are gathered
+    into batches of up to batch_size images, waiting at most batch_delay
+    seconds for a batch to fill, and each batch is signed at once by
+    sign_batch. Without resolve_digest, images are signed by tag.
+    """
+
+    def __init__(self, resolve_digest=None, batch_size=1, batch_delay=0.2):
+        self.resolve_digest = resolve_digest
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.lock = threading.Lock()
+        self.batch = None
+        self.batches = 0
+
+    @abstractmethod
+    def sign_batch(self, references, **options) -> bool:
+        """
+        Sign the references at once, returning whether all were signed
+        """
+
+    def pinned_reference(self, reference):
+        """
+        Return the reference pinned to the digest of what was pushed, or None
+        if the digest cannot be found
+        """
+        if self.resolve_digest is None:
+            return reference
+        digest = self.resolve_digest(reference)
+        if digest is None:
+            logger.error(f"Unable to find the digest of {reference}")
+            return None
+        return f"{split_reference(reference)[0]}@{digest}"
+
+    def sign(self, reference, **options) -> bool:
+        reference = self.pinned_reference(reference)
+        if reference is None:
+            return False
+        with self.lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = SignBatch()
+            batch.references.append(reference)
+            if len(batch.references) >= self.batch_size:
+                batch.full.set()
+                self.batch = None
+        if not leader:
+            batch.done.wait()
+            return batch.success
+        try:
+            batch.full.wait(self.batch_delay)
+            with self.lock:
+                if self.batch is batch:
+                    self.batch = None
+                self.batches += 1
+            batch.success = self.sign_batch(list(batch.references), **options)
+        finally:
+            batch.done.set()
+        return batch.success
+
+
+class CosignSigner(Signer):
+    """
+    Signs images with `cosign sign`, using key as the signing key reference
+    (a key file, KMS URI or Kubernetes secret) or keyless signing without one
+    """
+
+    def __init__(self, key=None, **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+
+    def sign_batch(
+        self,
+        references,
+        dry_run=False,
+        live_output=False,
+        output=None,
+        executor=None,
+    ) -> bool:
+        cmd = ["cosign", "sign", "--yes"]
+        if self.key:
+            cmd.extend(["--key", self.key])
+        cmd.extend(references)
+        return get_executor(executor, dry_run).run(
+            cmd, live_output=live_output, output=output
+        )
+
+
+class LocalSigner(Signer):
+    """
+    Stand-in signer that writes a signature file per image to a directory,
+    for testing signing without a registry or signing keys
+    """
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+
+    def signature_path(self, reference):
+        return os.path.join(
+            self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", reference) + ".sig"
+        )
+
+    def sign_batch(self, references, dry_run=False, **_) -> bool:
+        for reference in references:
+            logger.info(f"Signing {reference} locally")
+            if dry_run:
+                continue
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.signature_path(reference), "w") as file:
+                json.dump(
+                    {
+                        "reference": reference,
+                        "signature": hashlib.sha256(
+                            reference.encode()
+                        ).hexdigest(),
+                    },
+                    file,
+                )
+        return True
@@ -1,22 +1,231 @@
+import collections
+import os
+import re
 import sys
-import subprocess
+import threading
+import time
 
 from wake_build.log import logger
+from wake_build.report import run_report
 
 
-def run_command(command, dry_run=False, live_output=False):
+DEFAULT_TAIL_SIZE = 64 * 1024
+
+output_lock = threading.Lock()
+
+
+def log_file_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name) + ".log"
+
+
+class CommandOutput:
+    """
+    Sink for the output of a command, fed one line at a time. Only the last
+    tail_size bytes are kept in memory for failure reports. The full output
+    can be appended to a per-name file in log_dir, and live output can be
+    prefixed with the name so concurrent commands stay readable.
+    """
+
+    def __init__(
+        self,
+        name=None,
+        live_output=False,
+        log_dir=None,
+        prefix_output=False,
+        tail_size=DEFAULT_TAIL_SIZE,
+    ):
+        self.name = name
+        self.live_output = live_output
+        self.log_dir = log_dir if name is not None else None
+        self.prefix = f"[{name}] ".encode() if name and prefix_output else b""
+        self.tail_size = tail_size
+        self.lines = collections.deque()
+        self.size = 0
+        self.log_file = None
+
+    @property
+    def passthrough(self):
+        """
+        Whether output can go straight to the terminal, untouched
+        """
+        return self.live_output and not self.prefix and not self.log_dir
+
+    def start(self, command):
+        if self.log_dir is not None and self.log_file is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.log_file = open(
+                os.path.join(self.log_dir, log_file_name(self.name)), "ab"
+            )
+        if self.log_file is not None:
+            self.log_file.write(f"$ {' '.join(command)}\n".encode())
+
+    def write(self, line):
+        if isinstance(line, str):
+            line = line.encode()
+        if line and not line.endswith(b"\n"):
+            line += b"\n"
+        if self.log_file is not None:
+            self.log_file.write(line)
+        if self.live_output:
+            with output_lock:
+                sys.stdout.buffer.write(self.prefix + line)
+                sys.stdout.flush()
+        if len(line) > self.tail_size:
+            line = line[-self.tail_size :]
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.tail_size:
+            self.size -= len(self.lines.popleft())
+
+    def tail(self):
+        return b"".join(self.lines)
+
+    def dump_tail(self):
+        """
+        Write the retained output to stdout, unless it was already shown live
+        """
+        if self.live_output:
+            return
+        with output_lock:
+            for line in self.lines:
+                sys.stdout.buffer.write(self.prefix + line)
+            sys.stdout.flush()
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+
+def get_output(output=None, live_output=False):
+    if output is None:
+        output = CommandOutput(live_output=live_output)
+    return output
+
+
+# Processes started by run_command that are still running
+running_processes = set()
+running_processes_lock = threading.Lock()
+
+
+def terminate_commands():
+    """
+    Terminate every command currently started by run_command, which then
+    fail as usual
+    """
+    with running_processes_lock:
+        processes = list(running_processes)
+    for proc in processes:
+        try:
+            proc.terminate()
+        except OSError:
+            pass
+
+
+def run_command(
+    command, dry_run=False, live_output=False, output=None, stdin=None
+):
+    """
+    Run a command, streaming its output to `output`. stdin is the path of a
+    file to feed to the command.
+    """
     logger.info(f"Running command: `{' '.join(command)}`")
     if dry_run:
         return True
-    args = {
-        "stderr": None if live_output else subprocess.PIPE,
-        "stdout": None if live_output else subprocess.PIPE,
-    }
-    proc = subprocess.run(command, **args)
-    if proc.returncode:
-        if not live_output:
-            logger.error(
-                f"Command `{' '.join(command)}` failed with return code: {proc.returncode}"
+    import subprocess
+
+    output = get_output(output, live_output)
+    start = run_report.now()
+    returncode = None
+    stdin_file = open(stdin, "rb") if stdin is not None else None
+    try:
+        if output.passthrough:
+            proc = subprocess.Popen(command, stdin=stdin_file)
+            with running_processes_lock:
+                running_processes.add(proc)
+            try:
+                returncode = proc.wait()
+            finally:
+                with running_processes_lock:
+                    running_processes.discard(proc)
+            return returncode == 0
+        output.start(command)
+        proc = None
+        try:
+            proc = subprocess.Popen(
+                command,
+                stdin=stdin_file,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            with running_processes_lock:
+                running_processes.add(proc)
+            for line in iter(proc.stdout.readline, b""):
+                output.write(line)
+            proc.stdout.close()
+            returncode = proc.wait()
+        finally:
+            if proc is not None:
+                with running_processes_lock:
+                    running_processes.discard(proc)
+            output.close()
+    finally:
+        if stdin_file is not None:
+            stdin_file.close()
+        run_report.record_command(
+            output.name, command, start, run_report.now(), returncode
+        )
+    if returncode:
+        logger.error(
+            f"Command `{' '.join(command)}` failed with return code: {returncode}"
+        )
+        output.dump_tail()
+    return returncode == 0
+
+
+def retry(func, retries=0, delay=1.0, description="command"):
+    """
+    Call func until it returns a truthy value, retrying up to `retries` more
+    times with an exponential backoff starting at `delay` seconds
+    """
+    for attempt in range(retries + 1):
+        if func():
+            return True
+        if attempt < retries:
+            wait = delay * 2**attempt
+            logger.warning(
+                f"Retrying {description} in {wait:g}s "
+                f"(attempt {attempt + 2} of {retries + 1})"
             )
-        sys.stdout.write(proc.stderr.decode())
-    return proc.returncode == 0
+            time.sleep(wait)
+    return False
+
+
+def capture_command(command):
+    """
+    Run a command quietly and return its decoded stdout, or None if it failed
+    """
+    import subprocess
+
+    logger.debug(f"Running command: `{' '.join(command)}`")
+    proc = subprocess.run(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if proc.returncode:
+        return None
+    return proc.stdout.decode()
+
+
+def get_changed_files(ref):
+    """
+    Return the paths, relative to the working directory, of files changed
+    since a git ref including uncommitted and untracked files, or None if git
+    failed
+    """
+    changed = capture_command(["git", "diff", "--name-only", "--relative", ref])
+    untracked = capture_command(
+        ["git", "ls-files", "--others", "--exclude-standard"]
+    )
+    if changed is None or untracked is None:
+        return None
+    return [path for path in (changed + untracked).splitlines() if path]
@@ -1,187 +1,1096 @@
 import os
-import subprocess
 import sys
-from argparse import ArgumentParser
-from dotenv import load_dotenv, find_dotenv
-
-import tqdm
+import threading
+import time
+from argparse import ArgumentParser, ArgumentTypeError
 
 from wake_build.config import (
+    apply_build_caches,
+    expand_platforms,
+    is_multi_platform,
+    platform_variants,
+    get_resource_demand,
+    parse_memory,
     load_config,
     validate_images_schema,
     get_image_config,
-    get_dependency_targets,
+    get_affected_targets,
+    get_image_graph,
     get_matching_targets,
     validate_images_dependencies,
 )
+from wake_build.bake import BAKE_FILE, bake_images
+from wake_build.builders import BuilderPool
+from wake_build.cache import BuildCache, get_cache_dir
+from wake_build.context import CONTEXTS_DIR, SharedContexts
 from wake_build.exc import NoConfigFoundException
+from wake_build.executor import SimulatedExecutor, get_executor
+from wake_build.history import (
+    DEFAULT_DURATION,
+    BuildHistory,
+    simulate_schedule,
+    upward_ranks,
+)
+from wake_build.journal import RunJournal
 from wake_build.log import logger, configure_logger
-from wake_build.docker import build_image, pull_image, tag_image, push_image
+from wake_build.util import CommandOutput, get_changed_files, retry
+from wake_build.docker import (
+    build_image,
+    create_manifest,
+    pull_image,
+    tag_image,
+    push_image,
+    get_registry,
+    image_reference,
+)
+from wake_build.report import run_report
+from wake_build.scheduler import run_graph, log_outcomes, FAILED
 
+# Seconds to wait for changes before checking on a running build
+WATCH_INTERVAL = 0.5
 
-def pull_images(
-    images_data,
-    targets=[],
-    dry_run=False,
-    show_progress=False,
-    live_output=False,
-    **_,
+# Truthy result of a step skipped because its work was already done
+UNCHANGED = "unchanged"
+
+
+def describe_target(target):
+    return ":".join(target)
+
+
+def describe_step(step):
+    action, target = step
+    return f"{action} {describe_target(target)}".strip()
+
+
+def resolve_targets(
+    images_data, targets, action, with_dependencies=False, only=None
 ):
-    targets = get_matching_targets(images_data, targets, "pull")
+    """
+    Resolve the requested targets for an action into a set of (name, tag)
+    tuples, defaulting to every image with that action. Multi-platform
+    images resolve to their per-platform variants. If only is given the
+    result is restricted to those images.
+    """
+    graph = get_image_graph(images_data)
+    targets = get_matching_targets(graph, targets, action)
     if not len(targets):
-        targets = [
-            (image["name"], image["tag"])
-            for image in filter(lambda x: "pull" in x["actions"], images_data)
-        ]
-    pull_targets = set(targets)
-    for target in pull_targets.copy():
-        dep_targets = get_dependency_targets(images_data, target, "pull")
-        pull_targets.update(dep_targets)
+        targets = graph.with_action(action)
+    resolved = set()
+    for key in targets:
+        image = graph.get(key)
+        if not is_multi_platform(image) or action not in [
+            "build",
+            "tag",
+            "push",
+        ]:
+            resolved.add(key)
+            continue
+        # Multi-platform images are built, tagged and pushed per platform,
+        # and their own push assembles the pushed variants
+        resolved.update(platform_variants(image))
+        if action == "push":
+            resolved.add(key)
+    if with_dependencies:
+        resolved.update(
+            key
+            for key in graph.closure(resolved)
+            if action in graph.get(key)["actions"]
+        )
+    if only is not None:
+        resolved.intersection_update(only)
+    return resolved
+
+
+def registry_key(prefix=""):
+    """
+    Return a scheduler limit key that groups pulls and pushes by the registry
+    they transfer to, leaving every other step unlimited
+    """
+
+    def key(step):
+        action, target = step
+        if action == "pull":
+            return get_registry(describe_target(target))
+        if action in ["push", "sign"]:
+            return get_registry(prefix + describe_target(target))
+        return None
+
+    return key
+
+
+def resource_demand(images_data):
+    """
+    Return a scheduler demand function giving the resources each build step
+    declares, leaving every other step free
+    """
+    graph = get_image_graph(images_data)
+
+    def demand(step):
+        action, target = step
+        if action == "build":
+            return get_resource_demand(graph.get(target))
+        return (0, 0)
+
+    return demand
+
+
+def run_steps(
+    dependencies,
+    operation,
+    phase,
+    desc,
+    show_progress=False,
+    jobs=1,
+    keep_going=False,
+    limit_key=None,
+    limit=None,
+    history=None,
+    demand=None,
+    capacity=None,
+):
+    """
+    Run operation on every (action, target) step through the scheduler once
+    the steps it depends on succeeded, exiting if any of them failed. With a
+    history, steps heading the longest predicted chains are started first
+    and the duration of every step that did its work is recorded, leaving
+    out steps returning UNCHANGED. With a capacity, steps only start while
+    their resource demand fits.
+    """
+    priority = None
+    timed_operation = operation
+    if history is not None:
+        durations = {
+            step: history.estimate(describe_step(step)) for step in dependencies
+        }
+        priority = upward_ranks(dependencies, durations)
+
+        def timed_operation(step):
+            start = time.time()
+            success = operation(step)
+            if success and success != UNCHANGED:
+                history.record(describe_step(step), time.time() - start)
+            return success
+
     if show_progress:
-        progress = tqdm.tqdm(total=len(pull_targets), desc="Pulling")
-    for target in pull_targets:
-        image = get_image_config(images_data, target)
-        success = pull_image(image, dry_run=dry_run, live_output=live_output)
-        if not success:
-            logger.critical(
-                f"Failed to pull image: {image['name']}:{image['tag']}"
-            )
-            exit(1)
+        import tqdm
+
+        progress = tqdm.tqdm(total=len(dependencies), desc=desc)
+
+    def update_progress(step, outcome):
         if show_progress:
             progress.update(1)
+
+    with run_report.phase(phase):
+        try:
+            outcomes = run_graph(
+                dependencies,
+                dependencies,
+                timed_operation,
+                jobs=jobs,
+                keep_going=keep_going,
+                on_complete=update_progress,
+                limit_key=limit_key,
+                limit=limit,
+                report=run_report,
+                describe=describe_step,
+                priority=priority,
+                demand=demand,
+                capacity=capacity,
+            )
+        finally:
+            if history is not None:
+                history.save()
     if show_progress:
         progress.close()
+    log_outcomes(outcomes, describe=describe_step)
+    if FAILED in outcomes.values():
+        exit(1)
+    return outcomes
 
 
-def build_images(
+def run_action(
     images_data,
-    targets=[],
+    action,
+    target,
+    prefix="",
     dry_run=False,
-    show_progress=False,
     live_output=False,
+    retries=0,
+    retry_delay=1.0,
+    build_cache=None,
+    client=None,
+    log_dir=None,
+    prefix_output=False,
+    digest_checker=None,
+    executor=None,
+    builders=None,
+    signer=None,
+    shared_contexts=None,
+    journal=None,
     **_,
 ):
-    targets = get_matching_targets(images_data, targets, "build")
-    if not len(targets):
-        targets = [
-            (image["name"], image["tag"])
-            for image in filter(lambda x: "build" in x["actions"], images_data)
-        ]
-    build_targets = set(targets)
-    for target in build_targets.copy():
-        dep_targets = get_dependency_targets(images_data, target, "build")
-        build_targets.update(dep_targets)
-    remaining_targets = build_targets.copy()
-    if show_progress:
-        progress = tqdm.tqdm(total=len(remaining_targets), desc="Building")
-    while len(remaining_targets):
-        did_something = False
-        for target in remaining_targets.copy():
-            image = get_image_config(images_data, target)
-            unbuilt_dependencies = False
-            for dep in image.get("dependencies", []):
-                # Will only be in remaining_targets if it requires building
-                if (dep["name"], dep["tag"]) in remaining_targets:
-                    unbuilt_dependencies = True
-                    break
-            if unbuilt_dependencies:
-                continue
-            # TODO add a way to build images concurrently when possible
-            if not build_image(image, dry_run=dry_run, live_output=live_output):
+    """
+    Run a single action against a single target image, returning whether it
+    succeeded, or UNCHANGED if there was nothing to do. Network transfers are retried on failure and builds whose
+    inputs are unchanged since the last build are skipped, as are pulls and
+    pushes of images whose digest already matches the registry. With a pool
+    of builders, builds and the tags and pushes of built images run on them.
+    With a journal, completed steps are recorded and steps the resumed run
+    already completed are skipped.
+    """
+    if builders is not None and action in ["build", "tag", "push"]:
+        return builders.run(
+            images_data,
+            action,
+            target,
+            lambda executor: run_action(
+                images_data,
+                action,
+                target,
+                prefix=prefix,
+                dry_run=dry_run,
+                live_output=live_output,
+                retries=retries,
+                retry_delay=retry_delay,
+                build_cache=build_cache,
+                client=client,
+                log_dir=log_dir,
+                prefix_output=prefix_output,
+                digest_checker=digest_checker,
+                signer=signer,
+                shared_contexts=shared_contexts,
+                executor=executor,
+            ),
+            live_output=live_output,
+        )
+    image = get_image_config(images_data, target)
+    if journal is not None and journal.is_done(action, image, prefix):
+        logger.info(
+            f"Skipping {action} of {describe_target(target)}, "
+            "completed in the resumed run"
+        )
+        return UNCHANGED
+    if action in ["pull", "push"] and digest_checker is not None:
+        reference = image_reference(image, prefix if action == "push" else "")
+        if digest_checker.is_current(reference):
+            logger.info(f"Skipping {action} of {reference}, digest unchanged")
+            return UNCHANGED
+    output = CommandOutput(
+        name=describe_target(target),
+        live_output=live_output,
+        log_dir=log_dir,
+        prefix_output=prefix_output,
+    )
+    if action == "pull":
+        success = retry(
+            lambda: pull_image(
+                image,
+                dry_run=dry_run,
+                live_output=live_output,
+                client=client,
+                output=output,
+                executor=executor,
+            ),
+            retries=retries,
+            delay=retry_delay,
+            description=f"pull of {describe_target(target)}",
+        )
+    elif action == "build":
+        if build_cache is not None and build_cache.is_fresh(image):
+            logger.info(
+                f"Skipping build of {describe_target(target)}, inputs unchanged"
+            )
+            return UNCHANGED
+        context_archive = None
+        if shared_contexts is not None:
+            try:
+                context_archive = shared_contexts.archive(image)
+            except OSError as e:
                 logger.critical(
-                    f"Failed to build image: {image['name']}:{image['tag']}"
+                    f"Unable to pack context of {describe_target(target)}: {e}"
                 )
-                exit(1)
-            remaining_targets.remove(target)
-            did_something = True
-            if show_progress:
-                progress.update(1)
-        if not did_something:
-            raise ValueError("Circular dependency detected")
-    if show_progress:
-        progress.close()
+                return False
+        success = build_image(
+            image,
+            dry_run=dry_run,
+            live_output=live_output,
+            client=client,
+            output=output,
+            executor=executor,
+            context_archive=context_archive,
+        )
+        if success and build_cache is not None:
+            build_cache.record(image)
+    elif action == "tag":
+        success = tag_image(
+            image,
+            prefix=prefix,
+            dry_run=dry_run,
+            live_output=live_output,
+            client=client,
+            output=output,
+            executor=executor,
+        )
+    elif action == "push":
+        push = create_manifest if is_multi_platform(image) else push_image
+        success = retry(
+            lambda: push(
+                image,
+                prefix=prefix,
+                dry_run=dry_run,
+                live_output=live_output,
+                client=client,
+                output=output,
+                executor=executor,
+            ),
+            retries=retries,
+            delay=retry_delay,
+            description=f"push of {prefix}{describe_target(target)}",
+        )
+    elif action == "sign":
+        if signer is None:
+            logger.critical("No signer configured")
+            return False
+        success = retry(
+            lambda: signer.sign(
+                image_reference(image, prefix),
+                dry_run=dry_run,
+                live_output=live_output,
+                output=output,
+                executor=executor,
+            ),
+            retries=retries,
+            delay=retry_delay,
+            description=f"signing of {prefix}{describe_target(target)}",
+        )
+    else:
+        raise ValueError(f"Unknown action: {action}")
+    if not success:
+        logger.critical(
+            f"Failed to {action} image: {image['name']}:{image['tag']}"
+        )
+    elif journal is not None:
+        journal.record(action, image, prefix)
+    return success
 
 
-def tag_images(
+def get_build_dependencies(images_data, build_targets):
+    graph = get_image_graph(images_data)
+    return {target: graph.dependencies(target) for target in build_targets}
+
+
+def open_build_cache(
     images_data,
-    targets=[],
-    prefix="",
+    cache_dir=None,
+    force=False,
+    dry_run=False,
+    client=None,
+    executor=None,
+    builders=None,
+    log_dir=None,
+    report_paths=(),
+    journal=None,
+    **_,
+):
+    """
+    Return the build cache to consult during builds, or None when builds
+    should always run, as they do when they do not really run or run on
+    builders whose images the cache cannot inspect
+    """
+    if cache_dir is None or builders is not None:
+        return None
+    if not get_executor(executor, dry_run).real:
+        return None
+    return BuildCache(
+        images_data,
+        cache_dir,
+        force=force,
+        client=client,
+        exclude=wake_outputs(log_dir, report_paths),
+        fingerprinter=journal.fingerprinter if journal is not None else None,
+    )
+
+
+def wake_outputs(log_dir=None, report_paths=()):
+    """
+    Return the paths wake itself writes to during a run, which are never
+    build inputs even when they sit inside a context
+    """
+    return [path for path in [log_dir, *report_paths] if path]
+
+
+def open_journal(
+    images_data,
+    cache_dir=None,
+    resume=False,
+    dry_run=False,
+    client=None,
+    executor=None,
+    builders=None,
+    log_dir=None,
+    report_paths=(),
+    insecure_registries=(),
+):
+    """
+    Return the journal to record completed steps in, or None when steps do
+    not really run or run on builders whose images it cannot inspect
+    """
+    if cache_dir is None or builders is not None:
+        if resume:
+            logger.warning("Runs on builders cannot be resumed")
+        return None
+    if not get_executor(executor, dry_run).real:
+        return None
+    # Only a resumed run checks recorded pushes against the registry
+    resolve_digest = None
+    if resume:
+        from wake_build.registry import RegistryClient
+
+        resolve_digest = RegistryClient(
+            insecure_registries=insecure_registries
+        ).get_digest
+    return RunJournal(
+        images_data,
+        cache_dir,
+        resume=resume,
+        client=client,
+        resolve_digest=resolve_digest,
+        exclude=wake_outputs(log_dir, report_paths),
+    )
+
+
+def open_shared_contexts(
+    images_data,
+    build_targets,
+    cache_dir=None,
+    share_contexts=False,
+    dry_run=False,
+    executor=None,
+    log_dir=None,
+    report_paths=(),
+    **_,
+):
+    """
+    Return the shared context archives for the build targets, or None when
+    contexts should be sent to each build as usual
+    """
+    if not share_contexts or cache_dir is None:
+        return None
+    if not get_executor(executor, dry_run).real:
+        return None
+    graph = get_image_graph(images_data)
+    return SharedContexts(
+        [graph.get(target) for target in build_targets],
+        os.path.join(cache_dir, CONTEXTS_DIR),
+        exclude=[cache_dir, *wake_outputs(log_dir, report_paths)],
+    )
+
+
+def run_bake(
+    images_data,
+    build_targets,
+    build_cache=None,
+    cache_dir=None,
     dry_run=False,
-    show_progress=False,
     live_output=False,
+    log_dir=None,
+    executor=None,
     **_,
 ):
-    targets = get_matching_targets(images_data, targets, "tag")
-    if not len(targets):
-        targets = [
-            (image["name"], image["tag"])
-            for image in filter(lambda x: "tag" in x["actions"], images_data)
-        ]
-    tag_targets = set(targets)
-    if show_progress:
-        progress = tqdm.tqdm(total=len(tag_targets), desc="Tagging")
-    for target in tag_targets:
-        image = get_image_config(images_data, target)
-        success = tag_image(
-            image, prefix=prefix, dry_run=dry_run, live_output=live_output
-        )
-        if not success:
-            logger.critical(
-                f"Failed to tag image: {image['name']}:{image['tag']}"
+    """
+    Build every target with a single bake, returning whether it succeeded.
+    The bake is skipped, returning UNCHANGED, if no image's inputs changed
+    since it was built.
+    """
+    graph = get_image_graph(images_data)
+    images = [graph.get(target) for target in build_targets]
+    if build_cache is not None and all(map(build_cache.is_fresh, images)):
+        logger.info("Skipping bake, inputs of all images unchanged")
+        return UNCHANGED
+    bake_file = os.path.join(cache_dir or ".", BAKE_FILE)
+    success = bake_images(
+        graph,
+        build_targets,
+        bake_file,
+        dry_run=dry_run,
+        live_output=live_output,
+        output=CommandOutput(
+            name="bake", live_output=live_output, log_dir=log_dir
+        ),
+        executor=executor,
+    )
+    if not success:
+        logger.critical("Failed to bake images")
+    elif build_cache is not None:
+        for image in images:
+            build_cache.record(image)
+    return success
+
+
+def pull_images(
+    images_data,
+    targets=[],
+    show_progress=False,
+    jobs=1,
+    keep_going=False,
+    registry_jobs=None,
+    history=None,
+    only=None,
+    digest_checker=None,
+    **kwargs,
+):
+    images_data = get_image_graph(images_data)
+    pull_targets = resolve_targets(
+        images_data, targets, "pull", with_dependencies=True, only=only
+    )
+    run_steps(
+        {("pull", target): [] for target in pull_targets},
+        lambda step: run_action(
+            images_data, *step, digest_checker=digest_checker, **kwargs
+        ),
+        "pull",
+        "Pulling",
+        show_progress=show_progress,
+        jobs=jobs,
+        keep_going=keep_going,
+        limit_key=registry_key(),
+        limit=registry_jobs,
+        history=history,
+    )
+    if digest_checker is not None:
+        digest_checker.log_summary()
+
+
+def build_images(
+    images_data,
+    targets=[],
+    show_progress=False,
+    jobs=1,
+    keep_going=False,
+    bake=False,
+    history=None,
+    only=None,
+    capacity=None,
+    **kwargs,
+):
+    images_data = get_image_graph(images_data)
+    build_targets = resolve_targets(
+        images_data, targets, "build", with_dependencies=True, only=only
+    )
+    build_cache = open_build_cache(images_data, **kwargs)
+    shared_contexts = open_shared_contexts(images_data, build_targets, **kwargs)
+    if bake:
+        dependencies = {("bake", ()): []} if build_targets else {}
+    else:
+        dependencies = {
+            ("build", target): [("build", dep) for dep in deps]
+            for target, deps in get_build_dependencies(
+                images_data, build_targets
+            ).items()
+        }
+
+    def run_step(step):
+        action, target = step
+        if action == "bake":
+            return run_bake(
+                images_data, build_targets, build_cache=build_cache, **kwargs
             )
-            exit(1)
-        if show_progress:
-            progress.update(1)
-    if show_progress:
-        progress.close()
+        return run_action(
+            images_data,
+            action,
+            target,
+            build_cache=build_cache,
+            shared_contexts=shared_contexts,
+            **kwargs,
+        )
+
+    run_steps(
+        dependencies,
+        run_step,
+        "build",
+        "Building",
+        show_progress=show_progress,
+        jobs=jobs,
+        keep_going=keep_going,
+        history=history,
+        demand=resource_demand(images_data),
+        capacity=capacity,
+    )
+    if build_cache is not None:
+        build_cache.log_summary()
+    if shared_contexts is not None:
+        shared_contexts.log_summary()
+    if kwargs.get("builders") is not None:
+        kwargs["builders"].log_summary()
+
+
+def tag_images(
+    images_data,
+    targets=[],
+    show_progress=False,
+    jobs=1,
+    keep_going=False,
+    history=None,
+    only=None,
+    **kwargs,
+):
+    images_data = get_image_graph(images_data)
+    tag_targets = resolve_targets(images_data, targets, "tag", only=only)
+    run_steps(
+        {("tag", target): [] for target in tag_targets},
+        lambda step: run_action(images_data, *step, **kwargs),
+        "tag",
+        "Tagging",
+        show_progress=show_progress,
+        jobs=jobs,
+        keep_going=keep_going,
+        history=history,
+    )
+
+
+def manifest_dependencies(images_data, target, push_targets):
+    """
+    Return the push steps the push of an image waits on: the pushes of its
+    variants for a multi-platform image, whose manifest list refers to them
+    """
+    image = get_image_config(images_data, target)
+    if not is_multi_platform(image):
+        return []
+    return [
+        ("push", variant)
+        for variant in platform_variants(image)
+        if variant in push_targets
+    ]
 
 
 def push_images(
     images_data,
     targets=[],
     prefix="",
-    dry_run=False,
     show_progress=False,
-    live_output=False,
-    **_,
+    jobs=1,
+    keep_going=False,
+    registry_jobs=None,
+    history=None,
+    only=None,
+    digest_checker=None,
+    **kwargs,
 ):
-    targets = get_matching_targets(images_data, targets, "push")
-    if not len(targets):
-        targets = [
-            (image["name"], image["tag"])
-            for image in filter(lambda x: "push" in x["actions"], images_data)
-        ]
-    push_targets = set(targets)
-    if show_progress:
-        progress = tqdm.tqdm(total=len(push_targets), desc="Pushing")
-    for target in push_targets:
-        image = get_image_config(images_data, target)
-        success = push_image(
-            image, prefix=prefix, dry_run=dry_run, live_output=live_output
-        )
-        if not success:
-            logger.critical(
-                f"Failed to push image: {image['name']}:{image['tag']}"
+    images_data = get_image_graph(images_data)
+    push_targets = resolve_targets(images_data, targets, "push", only=only)
+    run_steps(
+        {
+            ("push", target): manifest_dependencies(
+                images_data, target, push_targets
             )
-            exit(1)
-        if show_progress:
-            progress.update(1)
-    if show_progress:
-        progress.close()
+            for target in push_targets
+        },
+        lambda step: run_action(
+            images_data,
+            *step,
+            prefix=prefix,
+            digest_checker=digest_checker,
+            **kwargs,
+        ),
+        "push",
+        "Pushing",
+        show_progress=show_progress,
+        jobs=jobs,
+        keep_going=keep_going,
+        limit_key=registry_key(prefix),
+        limit=registry_jobs,
+        history=history,
+    )
+    if digest_checker is not None:
+        digest_checker.log_summary()
 
 
-def build_tag_push_images(*args, **kwargs):
-    for func in [build_images, tag_images, push_images]:
+def sign_images(
+    images_data,
+    targets=[],
+    prefix="",
+    show_progress=False,
+    jobs=1,
+    keep_going=False,
+    registry_jobs=None,
+    history=None,
+    only=None,
+    **kwargs,
+):
+    images_data = get_image_graph(images_data)
+    sign_targets = resolve_targets(images_data, targets, "sign", only=only)
+    run_steps(
+        {("sign", target): [] for target in sign_targets},
+        lambda step: run_action(images_data, *step, prefix=prefix, **kwargs),
+        "sign",
+        "Signing",
+        show_progress=show_progress,
+        jobs=jobs,
+        keep_going=keep_going,
+        limit_key=registry_key(prefix),
+        limit=registry_jobs,
+        history=history,
+    )
+
+
+def get_pipeline_steps(images_data, targets=[], bake=False, only=None):
+    """
+    Return the dependencies between the build, tag, push and sign steps of a
+    pipeline run, along with the set of images to build
+    """
+    images_data = get_image_graph(images_data)
+    steps = {}
+    for action in ["build", "tag", "push", "sign"]:
         try:
-            func(*args, **kwargs)
+            steps[action] = resolve_targets(
+                images_data,
+                targets,
+                action,
+                with_dependencies=action == "build",
+                only=only,
+            )
         except ValueError:
+            # Targets without this action simply skip this stage
+            steps[action] = set()
+    dependencies = {}
+
+    def build_step(target):
+        if target not in steps["build"]:
+            return []
+        return [("bake", ())] if bake else [("build", target)]
+
+    if bake and steps["build"]:
+        dependencies[("bake", ())] = []
+    elif not bake:
+        build_dependencies = get_build_dependencies(images_data, steps["build"])
+        for target in steps["build"]:
+            dependencies[("build", target)] = [
+                ("build", dep) for dep in build_dependencies[target]
+            ]
+    for target in steps["tag"]:
+        dependencies[("tag", target)] = build_step(target)
+    for target in steps["push"]:
+        if is_multi_platform(images_data.get(target)):
+            dependencies[("push", target)] = manifest_dependencies(
+                images_data, target, steps["push"]
+            )
+            continue
+        dependencies[("push", target)] = (
+            [("tag", target)] if target in steps["tag"] else build_step(target)
+        )
+    for target in steps["sign"]:
+        if target in steps["push"]:
+            dependencies[("sign", target)] = [("push", target)]
+        elif target in steps["tag"]:
+            dependencies[("sign", target)] = [("tag", target)]
+        else:
+            dependencies[("sign", target)] = build_step(target)
+
+    return dependencies, steps["build"]
+
+
+def build_tag_push_images(
+    images_data,
+    targets=[],
+    prefix="",
+    show_progress=False,
+    jobs=1,
+    keep_going=False,
+    registry_jobs=None,
+    bake=False,
+    history=None,
+    only=None,
+    digest_checker=None,
+    capacity=None,
+    **kwargs,
+):
+    """
+    Build, tag, push and sign images as a single pipeline, so each image is
+    tagged, pushed and signed as soon as its own build finishes rather than
+    after every build. Only builds wait on the builds of their dependencies.
+    When baking, a single bake step replaces every build.
+    """
+    images_data = get_image_graph(images_data)
+    dependencies, build_targets = get_pipeline_steps(
+        images_data, targets, bake=bake, only=only
+    )
+    build_cache = open_build_cache(images_data, **kwargs)
+    shared_contexts = open_shared_contexts(images_data, build_targets, **kwargs)
+
+    def run_step(step):
+        action, target = step
+        if action == "bake":
+            return run_bake(
+                images_data, build_targets, build_cache=build_cache, **kwargs
+            )
+        return run_action(
+            images_data,
+            action,
+            target,
+            prefix=prefix,
+            build_cache=build_cache,
+            shared_contexts=shared_contexts,
+            digest_checker=digest_checker,
+            **kwargs,
+        )
+
+    run_steps(
+        dependencies,
+        run_step,
+        "all",
+        "Running",
+        show_progress=show_progress,
+        jobs=jobs,
+        keep_going=keep_going,
+        limit_key=registry_key(prefix),
+        limit=registry_jobs,
+        history=history,
+        demand=resource_demand(images_data),
+        capacity=capacity,
+    )
+    if build_cache is not None:
+        build_cache.log_summary()
+    if shared_contexts is not None:
+        shared_contexts.log_summary()
+    if kwargs.get("builders") is not None:
+        kwargs["builders"].log_summary()
+    if digest_checker is not None:
+        digest_checker.log_summary()
+
+
+def plan_images(
+    images_data,
+    targets=[],
+    jobs=1,
+    bake=False,
+    history=None,
+    only=None,
+    **_,
+):
+    """
+    Print the schedule `wake all` is predicted to follow with the given
+    number of jobs, based on step durations from previous runs
+    """
+    images_data = get_image_graph(images_data)
+    dependencies, _ = get_pipeline_steps(
+        images_data, targets, bake=bake, only=only
+    )
+    durations = {}
+    for step in dependencies:
+        name = describe_step(step)
+        durations[step] = (
+            history.estimate(name) if history is not None else DEFAULT_DURATION
+        )
+    schedule = simulate_schedule(dependencies, durations, jobs=jobs)
+    for start, end, slot, step in schedule:
+        name = describe_step(step)
+        estimated = history is None or name not in history.durations
+        sys.stdout.write(
+            f"{start:9.1f}s {end:9.1f}s  job {slot + 1:<3} {name}"
+            f"{' (estimated)' if estimated else ''}\n"
+        )
+    makespan = max((end for _, end, _, _ in schedule), default=0)
+    sys.stdout.write(f"Predicted makespan with {jobs} jobs: {makespan:.1f}s\n")
+
+
+def prepare_images(
+    images_data, default_tag="latest", cache_local=None, cache_registry=None
+):
+    """
+    Turn loaded config into the image graph to run: drop empty images, give
+    untagged images the default tag, validate, fan multi-platform images out
+    per platform and apply the build caches. Raises ValueError for an
+    invalid config.
+    """
+    # Remove any empty images
+    images_data = list(filter(lambda x: x, images_data))
+
+    for image in images_data:
+        if "tag" not in image:
+            image["tag"] = default_tag
+    validate_images_schema(images_data)
+    images_data = expand_platforms(images_data)
+    validate_images_dependencies(images_data)
+    images = get_image_graph(images_data)
+    apply_build_caches(
+        images, cache_local=cache_local, cache_registry=cache_registry
+    )
+    return images
+
+
+def watched_paths(images_data, config_location=None):
+    """
+    Return the paths whose changes affect a build: the config and the context
+    and dockerfile of every built image
+    """
+    graph = get_image_graph(images_data)
+    paths = [config_location] if config_location else []
+    for key in graph.with_action("build"):
+        image = graph.get(key)
+        context = image.get("context", ".")
+        paths.append(context)
+        paths.append(
+            image.get("dockerfile", os.path.join(context, "Dockerfile"))
+        )
+    return paths
+
+
+def is_within(path, location):
+    path, location = os.path.abspath(path), os.path.abspath(location)
+    return path == location or path.startswith(location + os.sep)
+
+
+def changed_images(old_images, new_images):
+    """
+    Return the images whose config differs between two loads of the config,
+    plus everything depending on them
+    """
+    old_images = get_image_graph(old_images)
+    new_images = get_image_graph(new_images)
+    changed = {
+        key
+        for key in new_images.nodes
+        if old_images.get(key) != new_images.get(key)
+    }
+    return new_images.closure(changed, reverse=True)
+
+
+def cancel_build(thread, executor=None, dry_run=False):
+    """
+    Cancel the commands of a build running in thread until it finishes
+    """
+    while thread.is_alive():
+        get_executor(executor, dry_run).cancel()
+        thread.join(0.1)
+
+
+def watch_images(
+    images_data,
+    targets=[],
+    reload_images=None,
+    config_location=None,
+    debounce=0.3,
+    polling=False,
+    stop=None,
+    only=None,
+    dry_run=False,
+    executor=None,
+    **kwargs,
+):
+    """
+    Build the targets, then keep watching the config and the context and
+    dockerfile of every built image, rebuilding the images affected by each
+    burst of changes and their dependents. If changes arrive while a build
+    is running, it is cancelled and its images built again along with the
+    newly affected ones; images it already finished are skipped by the
+    build cache.
+    """
+    from wake_build.watch import collect_changes, open_watcher
+
+    images = get_image_graph(images_data)
+    pending = resolve_targets(
+        images, targets, "build", with_dependencies=True, only=only
+    )
+    running = None
+    # Wake's own output can live inside a watched context
+    ignored = [
+        path
+        for path in [kwargs.get("cache_dir"), kwargs.get("log_dir")]
+        if path
+    ]
+    watcher = open_watcher(
+        watched_paths(images, config_location), polling=polling
+    )
+
+    def run_build(round_images, round_targets):
+        try:
+            build_images(
+                round_images,
+                targets,
+                only=round_targets,
+                dry_run=dry_run,
+                executor=executor,
+                **kwargs,
+            )
+        except SystemExit:
+            # Failures were already logged, keep watching for a fix
             pass
 
+    try:
+        while stop is None or not stop.is_set():
+            if running is not None and not running[0].is_alive():
+                running = None
+            if running is None and pending:
+                thread = threading.Thread(
+                    target=run_build, args=(images, pending), daemon=True
+                )
+                running, pending = (thread, pending), set()
+                thread.start()
+            changed = {
+                path
+                for path in collect_changes(watcher, WATCH_INTERVAL, debounce)
+                if not any(is_within(path, other) for other in ignored)
+            }
+            if not changed:
+                continue
+            affected = set()
+            if config_location and any(
+                is_within(path, config_location) for path in changed
+            ):
+                try:
+                    new_images = reload_images()
+                    # The targets being watched must still exist
+                    resolve_targets(new_images, targets, "build")
+                except (ValueError, NoConfigFoundException) as e:
+                    logger.error(f"Keeping the previous config: {e}")
+                else:
+                    affected |= changed_images(images, new_images)
+                    images = new_images
+                    watcher.set_paths(watched_paths(images, config_location))
+            affected |= get_affected_targets(
+                images, [os.path.relpath(path) for path in changed]
+            )
+            affected &= resolve_targets(
+                images, targets, "build", with_dependencies=True
+            )
+            if not affected:
+                continue
+            logger.info(
+                "Rebuilding "
+                + ", ".join(sorted(describe_target(key) for key in affected))
+            )
+            if running is not None and running[0].is_alive():
+                logger.info("Cancelling the superseded build")
+                cancel_build(running[0], executor, dry_run)
+                pending |= running[1]
+            running = None
+            pending |= affected
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if running is not None:
+            cancel_build(running[0], executor, dry_run)
+        watcher.close()
+
+
+def write_report(report_path=None, trace_path=None):
+    try:
+        if report_path:
+            run_report.write_json(report_path)
+        if trace_path:
+            run_report.write_trace(trace_path)
+    except OSError as e:
+        logger.error(f"Unable to write run report: {e}")
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 
 def main():
-    load_dotenv(
-        find_dotenv(usecwd=True)
-    )  # Use .env in directory where the user runs the script
     parser = ArgumentParser("wake")
     parser.add_argument("-v", "--verbose", action="count", default=0)
     parser.add_argument("-f", "--config", type=str)
@@ -189,6 +1098,39 @@ def main():
     parser.add_argument("-d", "--default-tag", type=str, default="latest")
     parser.add_argument("-t", "--tag-prefix", type=str, default=None)
     parser.add_argument("-p", "--cosign-profile", type=str, default=None)
+    parser.add_argument("-j", "--jobs", type=positive_int, default=1)
+    parser.add_argument("-k", "--keep-going", action="store_true")
+    parser.add_argument("--registry-jobs", type=positive_int, default=None)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry-delay", type=float, default=1.0)
+    parser.add_argument("--cache-dir", type=str, default=None)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--backend", choices=["cli", "api"], default="cli")
+    parser.add_argument("--docker-host", type=str, default=None)
+    parser.add_argument("--bake", action="store_true")
+    parser.add_argument("--log-dir", type=str, default=None)
+    parser.add_argument("--report", type=str, default=None)
+    parser.add_argument("--trace", type=str, default=None)
+    parser.add_argument("--changed-since", type=str, default=None)
+    parser.add_argument("--changed-files", action="store_true")
+    parser.add_argument("--check-digests", action="store_true")
+    parser.add_argument("--cache-local", type=str, default=None)
+    parser.add_argument("--cache-registry", type=str, default=None)
+    parser.add_argument("--simulate", type=str, default=None)
+    parser.add_argument("--builder", type=str, action="append", default=[])
+    parser.add_argument("--builder-jobs", type=int, default=1)
+    parser.add_argument(
+        "--signer", choices=["cosign", "local"], default="cosign"
+    )
+    parser.add_argument("--signature-dir", type=str, default=None)
+    parser.add_argument("--sign-batch-size", type=int, default=8)
+    parser.add_argument("--share-contexts", action="store_true")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--cpus", type=float, default=None)
+    parser.add_argument("--memory", type=str, default=None)
+    parser.add_argument(
+        "--insecure-registry", type=str, action="append", default=[]
+    )
     subparsers = parser.add_subparsers(dest="action", required=True)
 
     build_parser = subparsers.add_parser("build")
@@ -207,24 +1149,47 @@ def main():
     push_parser.set_defaults(func=push_images)
     push_parser.add_argument("targets", type=str, nargs="*")
 
+    sign_parser = subparsers.add_parser("sign")
+    sign_parser.set_defaults(func=sign_images)
+    sign_parser.add_argument("targets", type=str, nargs="*")
+
     all_parser = subparsers.add_parser("all")
     all_parser.set_defaults(func=build_tag_push_images)
     all_parser.add_argument("targets", type=str, nargs="*")
 
+    watch_parser = subparsers.add_parser("watch")
+    watch_parser.set_defaults(func=watch_images)
+    watch_parser.add_argument("targets", type=str, nargs="*")
+    watch_parser.add_argument("--debounce", type=float, default=0.3)
+    watch_parser.add_argument("--poll", action="store_true")
+
+    plan_parser = subparsers.add_parser("plan")
+    plan_parser.set_defaults(func=plan_images)
+    plan_parser.add_argument("targets", type=str, nargs="*")
+
     args = parser.parse_args()
+    if args.action != "plan":
+        # Only the steps wake runs read the environment, so planning can skip
+        # importing dotenv and searching for a .env file
+        from dotenv import load_dotenv, find_dotenv
+
+        load_dotenv(
+            find_dotenv(usecwd=True)
+        )  # Use .env in directory where the user runs the script
 
     configure_logger(args.verbose)
     show_progress = args.verbose < 1
     live_output = args.verbose > 2
     images_data = []
-    loaded_config = False
+    config_location = None
     targets = args.targets
     if "all" in targets:
         targets = []
+    cache_dir = get_cache_dir(args.cache_dir)
     if args.config:
         try:
-            images_data = load_config(args.config)
-            loaded_config = True
+            images_data = load_config(args.config, cache_dir=cache_dir)
+            config_location = args.config
         except NoConfigFoundException:
             logger.critical(
                 f"Specified config location not found: {args.config}"
@@ -233,37 +1198,209 @@ def main():
     else:
         for location in ["Wakefile", ".wake"]:
             try:
-                images_data = load_config(location)
-                loaded_config = True
+                images_data = load_config(location, cache_dir=cache_dir)
+                config_location = location
                 break
             except NoConfigFoundException:
                 pass
-    if not loaded_config:
+    if config_location is None:
         logger.critical("No config found")
         exit(1)
 
-    # Remove any empty images
-    images_data = list(filter(lambda x: x, images_data))
-
-    for image in images_data:
-        if "tag" not in image:
-            image["tag"] = args.default_tag
+    cache_local = (
+        args.cache_local
+        if args.cache_local is not None
+        else os.environ.get("WAKE_CACHE_LOCAL")
+    )
+    cache_registry = (
+        args.cache_registry
+        if args.cache_registry is not None
+        else os.environ.get("WAKE_CACHE_REGISTRY")
+    )
     try:
-        validate_images_schema(images_data)
-        validate_images_dependencies(images_data)
+        images = prepare_images(
+            images_data, args.default_tag, cache_local, cache_registry
+        )
     except ValueError as e:
         logger.critical(f"Invalid images file: {e}")
         exit(1)
+    capacity = None
+    if args.cpus is not None or args.memory is not None:
+        try:
+            capacity = (
+                args.cpus,
+                parse_memory(args.memory) if args.memory else None,
+            )
+        except ValueError as e:
+            logger.critical(str(e))
+            exit(1)
+        for key in images.with_action("build"):
+            if any(
+                total is not None and amount > total
+                for amount, total in zip(
+                    get_resource_demand(images.get(key)), capacity
+                )
+            ):
+                logger.warning(
+                    f"{describe_target(key)} needs more resources than "
+                    "available and will build alone"
+                )
+    only = None
+    if args.changed_since is not None or args.changed_files:
+        if args.changed_files:
+            changed_files = [line.strip() for line in sys.stdin if line.strip()]
+        else:
+            changed_files = get_changed_files(args.changed_since)
+            if changed_files is None:
+                logger.critical(
+                    f"Unable to list files changed since {args.changed_since}"
+                )
+                exit(1)
+        only = get_affected_targets(images, changed_files)
+        if not only:
+            logger.warning("No images are affected by the changed files")
+            return 0
+        logger.info(
+            "Images affected by the changed files: "
+            + ", ".join(sorted(describe_target(target) for target in only))
+        )
+    executor = None
+    if args.simulate:
+        try:
+            executor = SimulatedExecutor.from_file(args.simulate)
+        except (OSError, ValueError) as e:
+            logger.critical(f"Unable to load simulation: {e}")
+            exit(1)
+    jobs = args.jobs
+    builders = None
+    if args.builder:
+        if args.bake:
+            logger.critical("Builders cannot be combined with --bake")
+            exit(1)
+        builders = BuilderPool(
+            args.builder,
+            slots=args.builder_jobs,
+            executor=executor,
+            dry_run=args.dry_run,
+        )
+        jobs = max(jobs, len(builders) * args.builder_jobs)
+    # A simulated or distributed run only talks to daemons through commands
+    local = executor is None and builders is None
+    client = None
+    if args.backend == "api" and local:
+        try:
+            from wake_build.engine import EngineClient
+
+            client = EngineClient(
+                args.docker_host,
+                exclude=[
+                    cache_dir,
+                    *wake_outputs(args.log_dir, [args.report, args.trace]),
+                ],
+            )
+        except ValueError as e:
+            logger.critical(str(e))
+            exit(1)
+    digest_checker = None
+    if args.check_digests and local:
+        from wake_build.registry import DigestChecker, RegistryClient
+
+        digest_checker = DigestChecker(
+            RegistryClient(insecure_registries=args.insecure_registry),
+            client=client,
+        )
     prefix = (
         args.tag_prefix
         if args.tag_prefix is not None
         else os.environ.get("TAG_PREFIX", "")
     )
-    return args.func(
-        images_data,
-        targets,
-        dry_run=args.dry_run,
-        show_progress=show_progress,
-        prefix=prefix,
-        live_output=live_output,
-    )
+    signer = None
+    if args.action in ["sign", "all"]:
+        from wake_build.registry import RegistryClient
+        from wake_build.signing import CosignSigner, LocalSigner
+
+        # Images are signed by the digest pushed, except in dry or simulated
+        # runs, which push nothing
+        resolve_digest = None
+        if get_executor(executor, args.dry_run).real:
+            resolve_digest = RegistryClient(
+                insecure_registries=args.insecure_registry
+            ).get_digest
+        if args.signer == "local":
+            signer = LocalSigner(
+                args.signature_dir or os.path.join(cache_dir, "signatures"),
+                resolve_digest=resolve_digest,
+                batch_size=args.sign_batch_size,
+            )
+        else:
+            signer = CosignSigner(
+                key=args.cosign_profile,
+                resolve_digest=resolve_digest,
+                batch_size=args.sign_batch_size,
+            )
+    watch_options = {}
+    if args.action == "watch":
+        watch_options = dict(
+            config_location=config_location,
+            reload_images=lambda: prepare_images(
+                load_config(config_location, cache_dir=cache_dir),
+                args.default_tag,
+                cache_local,
+                cache_registry,
+            ),
+            debounce=args.debounce,
+            polling=args.poll,
+        )
+    journal = None
+    if args.action not in ["plan", "watch"]:
+        journal = open_journal(
+            images,
+            cache_dir=cache_dir,
+            resume=args.resume,
+            dry_run=args.dry_run,
+            client=client,
+            executor=executor,
+            builders=builders,
+            log_dir=args.log_dir,
+            report_paths=[args.report, args.trace],
+            insecure_registries=args.insecure_registry,
+        )
+    try:
+        return args.func(
+            images,
+            targets,
+            dry_run=args.dry_run,
+            show_progress=show_progress,
+            prefix=prefix,
+            live_output=live_output,
+            jobs=jobs,
+            keep_going=args.keep_going,
+            registry_jobs=args.registry_jobs,
+            retries=args.retries,
+            retry_delay=args.retry_delay,
+            cache_dir=cache_dir,
+            force=args.force,
+            client=client,
+            bake=args.bake,
+            log_dir=args.log_dir,
+            report_paths=[args.report, args.trace],
+            prefix_output=jobs > 1,
+            history=BuildHistory(
+                cache_dir,
+                read_only=not get_executor(executor, args.dry_run).real,
+            ),
+            only=only,
+            digest_checker=digest_checker,
+            executor=executor,
+            builders=builders,
+            signer=signer,
+            share_contexts=args.share_contexts,
+            journal=journal,
+            capacity=capacity,
+            **watch_options,
+        )
+    finally:
+        if journal is not None:
+            journal.log_summary()
+            journal.close()
+        write_report(args.report, args.trace)
@@ -0,0 +1,192 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from wake_build.log import logger
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def watched_directories(paths):
+    """
+    Return every directory to watch for changes to paths: directories and
+    everything below them, and the parent directory of files, since editors
+    often save by replacing a file rather than writing to it
+    """
+    directories = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, _ in os.walk(path):
+                directories.add(root)
+        else:
+            directories.add(os.path.dirname(path) or ".")
+    return directories
+
+
+class PollingWatcher:
+    """
+    Finds changed files by comparing the modification time and size of every
+    file under the watched paths between scans
+    """
+
+    def __init__(self, paths, interval=0.5):
+        self.interval = interval
+        self.set_paths(paths)
+
+    def scan(self):
+        state = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    for name in files:
+                        self.stat(os.path.join(root, name), state)
+            else:
+                self.stat(path, state)
+        return state
+
+    @staticmethod
+    def stat(path, state):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        state[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def set_paths(self, paths):
+        self.paths = sorted(set(paths))
+        self.state = self.scan()
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds for changes and return the changed paths
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.scan()
+            changed = {
+                path
+                for path in set(state) | set(self.state)
+                if state.get(path) != self.state.get(path)
+            }
+            self.state = state
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Finds changed files with Linux inotify, watching every directory under
+    the watched paths, including directories created later
+    """
+
+    def __init__(self, paths):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        self.set_paths(paths)
+
+    def add_directory(self, directory):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), WATCH_MASK
+        )
+        if wd >= 0:
+            self.directories[wd] = directory
+
+    def set_paths(self, paths):
+        for wd in list(self.directories):
+            self.libc.inotify_rm_watch(self.fd, wd)
+        self.directories = {}
+        for directory in watched_directories(paths):
+            self.add_directory(directory)
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds for changes and return the changed paths
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                for root, _, _ in os.walk(path):
+                    self.add_directory(root)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(paths, polling=False):
+    """
+    Return an inotify watcher for paths, or a polling watcher if polling is
+    set or inotify is unavailable
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            logger.info(f"Falling back to polling for changes: {e}")
+    return PollingWatcher(paths)
+
+
+def collect_changes(watcher, timeout, debounce):
+    """
+    Wait up to timeout seconds for a change, then keep collecting changes
+    until none arrive for debounce seconds, so a burst of saves becomes a
+    single set of changed paths
+    """
+    changed = watcher.poll(timeout)
+    while changed:
+        more = watcher.poll(debounce)
+        if not more:
+            break
+        changed |= more
+    return changed
@@ -0,0 +1,80 @@
+from wake_build.bake import bake_definition, bake_target_name
+
+
+images_data = [
+    {
+        "name": "ubuntu",
+        "tag": "22.04",
+        "actions": ["pull"],
+    },
+    {
+        "name": "base",
+        "tag": "1.0",
+        "dockerfile": "base.Dockerfile",
+        "actions": ["build"],
+        "dependencies": [{"name": "ubuntu", "tag": "22.04"}],
+    },
+    {
+        "name": "service",
+        "tag": "1.0",
+        "context": "app",
+        "target": "service1",
+        "build_args": {"MODE": "release"},
+        "actions": ["build"],
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+    },
+]
+
+
+def test_bake_target_name():
+    assert bake_target_name(("base-py", "1.0")) == "base-py_1_0"
+
+
+def test_bake_definition_links_dependencies():
+    definition = bake_definition(
+        images_data, [("base", "1.0"), ("service", "1.0")]
+    )
+    assert definition["group"]["default"]["targets"] == [
+        "base_1_0",
+        "service_1_0",
+    ]
+    base = definition["target"]["base_1_0"]
+    assert base["context"] == "."
+    assert base["dockerfile"] == "base.Dockerfile"
+    assert "contexts" not in base
+    service = definition["target"]["service_1_0"]
+    assert service["target"] == "service1"
+    assert service["args"] == {"MODE": "release"}
+    assert service["tags"] == ["service:1.0"]
+    assert service["contexts"] == {"base:1.0": "target:base_1_0"}
+
+
+def test_bake_definition_links_platform_variants():
+    variants = [
+        {
+            "name": "base",
+            "tag": "1.0-linux-arm64",
+            "platform": "linux/arm64",
+            "actions": ["build"],
+        },
+        {
+            "name": "app",
+            "tag": "1.0-linux-arm64",
+            "platform": "linux/arm64",
+            "actions": ["build"],
+            "dependencies": [{"name": "base", "tag": "1.0-linux-arm64"}],
+            "build_contexts": {
+                "base:1.0": "docker-image://base:1.0-linux-arm64"
+            },
+        },
+    ]
+    definition = bake_definition(
+        variants, [("base", "1.0-linux-arm64"), ("app", "1.0-linux-arm64")]
+    )
+    app = definition["target"]["app_1_0-linux-arm64"]
+    assert app["platforms"] == ["linux/arm64"]
+    assert app["contexts"] == {"base:1.0": "target:base_1_0-linux-arm64"}
+    definition = bake_definition(variants, [("app", "1.0-linux-arm64")])
+    assert definition["target"]["app_1_0-linux-arm64"]["contexts"] == {
+        "base:1.0": "docker-image://base:1.0-linux-arm64"
+    }
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+SCALING = os.path.join(
+    os.path.dirname(__file__), "..", "benchmark", "scaling.py"
+)
+
+
+def test_scaling_benchmark_records_history(tmp_path):
+    history = tmp_path / "results.jsonl"
+    for _ in range(2):
+        subprocess.run(
+            [
+                sys.executable,
+                SCALING,
+                "--sizes",
+                "10",
+                "50",
+                "--repeat",
+                "1",
+                "--history",
+                str(history),
+            ],
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+    records = [json.loads(line) for line in history.read_text().splitlines()]
+    assert len(records) == 2
+    assert set(records[0]["results"]) == {"10", "50"}
+    assert "schedule_all" in records[0]["results"]["50"]
@@ -0,0 +1,52 @@
+from wake_build import wake
+from wake_build.builders import BuilderPool
+from wake_build.executor import SimulatedExecutor
+
+images_data = [
+    {"name": "base", "tag": "1.0", "actions": ["pull"]},
+    {
+        "name": "lib",
+        "tag": "1.0",
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+        "actions": ["build"],
+    },
+] + [
+    {
+        "name": f"app{index}",
+        "tag": "1.0",
+        "dependencies": [{"name": "lib", "tag": "1.0"}],
+        "actions": ["build", "tag", "push"],
+    }
+    for index in range(2)
+]
+
+
+def builder_of(call):
+    command = call["command"]
+    return command[2] if command[1] == "--context" else None
+
+
+def test_builders_share_work_with_affinity():
+    executor = SimulatedExecutor(default_duration=0.05)
+    builders = BuilderPool(["a", "b"], executor=executor)
+    wake.build_tag_push_images(
+        images_data, prefix="r/", jobs=2, executor=executor, builders=builders
+    )
+    calls = {
+        (call["action"], call["reference"]): call for call in executor.calls
+    }
+    # The pulled base is fetched by the builder that needs it
+    assert builder_of(calls[("pull", "base:1.0")]) == builder_of(
+        calls[("build", "lib:1.0")]
+    )
+    # Both apps build at once, one of them after copying lib over
+    assert {
+        builder_of(calls[("build", f"app{index}:1.0")]) for index in range(2)
+    } == {"a", "b"}
+    assert builders.transfers == 1
+    assert ("transfer", "lib:1.0") in calls
+    # Images are tagged and pushed where they were built
+    for index in range(2):
+        built = builder_of(calls[("build", f"app{index}:1.0")])
+        assert builder_of(calls[("tag", f"app{index}:1.0")]) == built
+        assert builder_of(calls[("push", f"r/app{index}:1.0")]) == built
@@ -0,0 +1,96 @@
+import os
+
+from wake_build import cache
+from wake_build.cache import BuildCache, get_cache_dir, hash_directory
+
+
+images_data = [
+    {
+        "name": "base",
+        "tag": "1.0",
+        "context": "base",
+        "actions": ["build"],
+    },
+    {
+        "name": "app",
+        "tag": "1.0",
+        "context": "app",
+        "actions": ["build"],
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+    },
+]
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+def test_hash_directory_tracks_content(tmp_path):
+    write(tmp_path / "ctx" / "Dockerfile", "FROM scratch\n")
+    before = hash_directory(tmp_path / "ctx")
+    assert before == hash_directory(tmp_path / "ctx")
+    write(tmp_path / "ctx" / "file.txt", "hello\n")
+    assert before != hash_directory(tmp_path / "ctx")
+
+
+def test_build_cache_hits_until_dependency_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        cache, "inspect_image", lambda *_, **__: {"Id": "sha256:1"}
+    )
+    write("base/Dockerfile", "FROM scratch\n")
+    write("app/Dockerfile", "FROM base:1.0\n")
+    base, app = images_data
+
+    build_cache = BuildCache(images_data, ".wake-cache")
+    assert not build_cache.is_fresh(app)
+    build_cache.record(base)
+    build_cache.record(app)
+
+    build_cache = BuildCache(images_data, ".wake-cache")
+    assert build_cache.is_fresh(app)
+    assert not BuildCache(images_data, ".wake-cache", force=True).is_fresh(app)
+
+    write("base/Dockerfile", "FROM busybox\n")
+    build_cache = BuildCache(images_data, ".wake-cache")
+    assert not build_cache.is_fresh(base)
+    assert not build_cache.is_fresh(app)
+    assert (build_cache.hits, build_cache.misses) == (0, 2)
+
+
+def test_build_cache_requires_local_image(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cache, "inspect_image", lambda *_, **__: None)
+    write("base/Dockerfile", "FROM scratch\n")
+    build_cache = BuildCache(images_data, ".wake-cache")
+    build_cache.record(images_data[0])
+    assert not build_cache.is_fresh(images_data[0])
+
+
+def test_hash_directory_skips_ignored_files_and_wake_outputs(tmp_path):
+    write(tmp_path / "Dockerfile", "FROM scratch\n")
+    write(tmp_path / ".dockerignore", ".git\nrun.json\n")
+    before = hash_directory(tmp_path, exclude=[tmp_path / "logs"])
+    write(tmp_path / "run.json", "{}\n")
+    write(tmp_path / ".git" / "HEAD", "ref: refs/heads/main\n")
+    write(tmp_path / "logs" / "base.log", "built\n")
+    assert before == hash_directory(tmp_path, exclude=[tmp_path / "logs"])
+    write(tmp_path / "main.py", "print()\n")
+    assert before != hash_directory(tmp_path, exclude=[tmp_path / "logs"])
+
+
+def test_default_cache_dir_is_outside_the_working_directory(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path / "..")
+    monkeypatch.delenv("WAKE_CACHE_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "user-cache"))
+    default = get_cache_dir()
+    assert default.startswith(str(tmp_path / "user-cache" / "wake"))
+    monkeypatch.chdir(tmp_path)
+    assert get_cache_dir() != default
+    assert get_cache_dir("cache") == "cache"
+    monkeypatch.setenv("WAKE_CACHE_DIR", "env-cache")
+    assert get_cache_dir() == "env-cache"
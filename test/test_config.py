@@ -1,4 +1,20 @@
-from wake_build.config import get_dependency_targets
+import pytest
+
+from wake_build import config
+from wake_build.config import (
+    ImageGraph,
+    apply_build_caches,
+    cache_source,
+    expand_platforms,
+    get_affected_targets,
+    get_resource_demand,
+    load_config,
+    parse_memory,
+    get_dependency_targets,
+    get_matching_targets,
+    validate_images_dependencies,
+    validate_images_schema,
+)
 
 
 images_data = [
@@ -46,3 +62,248 @@ def test_get_target_dependencies_pull():
     expected = {("image3", "latest"), ("image4", "latest")}
     result = get_dependency_targets(images_data, target, "pull")
     assert result == expected, f"Expected {expected}, but got {result}"
+
+
+def test_image_graph_closure_and_order():
+    graph = ImageGraph(images_data)
+    assert graph.get(("image2", "latest")) is images_data[1]
+    assert graph.get(("missing", "latest")) is None
+    assert graph.closure([("image2", "latest")]) == {
+        ("image2", "latest"),
+        ("image3", "latest"),
+    }
+    assert graph.closure([("image3", "latest")], reverse=True) == {
+        ("image1", "latest"),
+        ("image2", "latest"),
+        ("image3", "latest"),
+    }
+    order = graph.topological_order()
+    for image in images_data:
+        for dep in image["dependencies"]:
+            assert order.index((dep["name"], dep["tag"])) < order.index(
+                (image["name"], image["tag"])
+            )
+
+
+def test_get_matching_targets():
+    assert get_matching_targets(images_data, ["image1"], "build") == [
+        ("image1", "latest")
+    ]
+    assert get_matching_targets(images_data, ["image3:latest"], "pull") == [
+        ("image3", "latest")
+    ]
+    with pytest.raises(ValueError):
+        get_matching_targets(images_data, ["image3"], "build")
+
+
+def test_validate_images_dependencies_reports_cycle():
+    images = [
+        {
+            "name": "a",
+            "tag": "1",
+            "actions": ["build"],
+            "dependencies": [{"name": "b", "tag": "1"}],
+        },
+        {
+            "name": "b",
+            "tag": "1",
+            "actions": ["build"],
+            "dependencies": [{"name": "c", "tag": "1"}],
+        },
+        {
+            "name": "c",
+            "tag": "1",
+            "actions": ["build"],
+            "dependencies": [{"name": "a", "tag": "1"}],
+        },
+    ]
+    with pytest.raises(ValueError, match="a:1 → b:1 → c:1 → a:1"):
+        validate_images_dependencies(images)
+    images[2]["dependencies"] = []
+    validate_images_dependencies(images)
+    assert ImageGraph(images_data).find_cycle() is None
+
+
+def test_load_config_directory(tmp_path):
+    (tmp_path / "a.json").write_text('{"name": "a", "actions": ["pull"]}')
+    (tmp_path / "b.yml").write_text(
+        "name: b\nactions: [build]\n---\nname: c\nactions: [build]\n"
+    )
+    (tmp_path / "d.yaml").write_text("- name: d\n  actions: [pull]\n")
+    names = [image["name"] for image in load_config(str(tmp_path))]
+    assert names == ["a", "b", "c", "d"]
+
+
+def test_load_config_cache(tmp_path, monkeypatch):
+    wakefile = tmp_path / "Wakefile"
+    wakefile.write_text("name: a\nactions: [pull]\n")
+    cache_dir = str(tmp_path / "cache")
+    assert load_config(str(wakefile), cache_dir=cache_dir)[0]["name"] == "a"
+
+    def fail(path):
+        raise AssertionError("Config should have been cached")
+
+    monkeypatch.setattr(config, "load_file", fail)
+    assert load_config(str(wakefile), cache_dir=cache_dir)[0]["name"] == "a"
+
+    monkeypatch.undo()
+    wakefile.write_text("name: bb\nactions: [pull]\n")
+    assert load_config(str(wakefile), cache_dir=cache_dir)[0]["name"] == "bb"
+
+
+def test_get_affected_targets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / ".dockerignore").write_text("docs\n")
+    images = [
+        {"name": "ubuntu", "tag": "22.04", "actions": ["pull"]},
+        {
+            "name": "base",
+            "tag": "1",
+            "context": "base",
+            "actions": ["build"],
+            "dependencies": [{"name": "ubuntu", "tag": "22.04"}],
+        },
+        {
+            "name": "app",
+            "tag": "1",
+            "context": "app",
+            "dockerfile": "dockerfiles/app.Dockerfile",
+            "actions": ["build", "push"],
+            "dependencies": [{"name": "base", "tag": "1"}],
+        },
+    ]
+    assert get_affected_targets(images, ["base/requirements.txt"]) == {
+        ("base", "1"),
+        ("app", "1"),
+    }
+    assert get_affected_targets(images, ["dockerfiles/app.Dockerfile"]) == {
+        ("app", "1")
+    }
+    assert get_affected_targets(images, ["app/src/main.py"]) == {("app", "1")}
+    assert get_affected_targets(images, ["app/docs/index.md"]) == set()
+    assert get_affected_targets(images, ["README.md", "basement/x"]) == set()
+
+
+def test_cache_source():
+    assert (
+        cache_source("type=local,dest=/cache/app,mode=max")
+        == "type=local,src=/cache/app"
+    )
+    assert (
+        cache_source("type=registry,ref=reg.local/app:cache,mode=max")
+        == "type=registry,ref=reg.local/app:cache"
+    )
+
+
+def test_apply_build_caches_includes_dependencies():
+    images = [
+        {"name": "base", "tag": "1.0", "actions": ["build"]},
+        {
+            "name": "team/app",
+            "tag": "1.0",
+            "dependencies": [{"name": "base", "tag": "1.0"}],
+            "actions": ["build"],
+            "cache_from": ["type=registry,ref=reg.local/app:main"],
+        },
+    ]
+    validate_images_schema(images)
+    apply_build_caches(images, cache_local="/cache", cache_registry="reg/")
+    assert images[0]["cache_to"] == [
+        "type=local,dest=/cache/base-1.0,mode=max",
+        "type=registry,ref=reg/base:1.0-cache,mode=max",
+    ]
+    assert images[1]["cache_from"] == [
+        "type=registry,ref=reg.local/app:main",
+        "type=local,src=/cache/team_app-1.0",
+        "type=registry,ref=reg/team/app:1.0-cache",
+        "type=local,src=/cache/base-1.0",
+        "type=registry,ref=reg/base:1.0-cache",
+    ]
+
+
+def test_validate_images_schema_cache_fields():
+    image = {"name": "app", "tag": "1.0", "actions": ["build"]}
+    with pytest.raises(ValueError):
+        validate_images_schema([{**image, "cache_to": "type=inline"}])
+    with pytest.raises(ValueError):
+        validate_images_schema([{**image, "cache_from": [{"type": "local"}]}])
+
+
+def test_validate_images_schema_resources():
+    image = {"name": "app", "tag": "1.0", "actions": ["build"]}
+    validate_images_schema([{**image, "resources": {"cpu": 4, "memory": "8g"}}])
+    for resources in [
+        [4],
+        {"gpu": 1},
+        {"cpu": -1},
+        {"cpu": "4"},
+        {"memory": "8 gigs"},
+    ]:
+        with pytest.raises(ValueError):
+            validate_images_schema([{**image, "resources": resources}])
+    assert get_resource_demand({**image, "resources": {"memory": "512m"}}) == (
+        0,
+        512 << 20,
+    )
+    assert parse_memory(1024) == 1024
+    assert parse_memory("1.5g") == 3 << 29
+
+
+def test_expand_platforms():
+    images = expand_platforms(
+        [
+            {"name": "ubuntu", "tag": "22.04", "actions": ["pull"]},
+            {
+                "name": "base",
+                "tag": "1.0",
+                "platforms": ["linux/amd64", "linux/arm64"],
+                "actions": ["build", "push", "sign"],
+                "dependencies": [{"name": "ubuntu", "tag": "22.04"}],
+            },
+            {
+                "name": "app",
+                "tag": "1.0",
+                "platforms": ["linux/arm64"],
+                "actions": ["build"],
+                "dependencies": [{"name": "base", "tag": "1.0"}],
+            },
+        ]
+    )
+    graph = ImageGraph(images)
+    base_arm = graph.get(("base", "1.0-linux-arm64"))
+    assert base_arm["platform"] == "linux/arm64"
+    assert base_arm["actions"] == ["build", "push"]
+    assert graph.dependencies(("base", "1.0-linux-arm64")) == [
+        ("ubuntu", "22.04")
+    ]
+    assert graph.dependencies(("base", "1.0")) == [
+        ("base", "1.0-linux-amd64"),
+        ("base", "1.0-linux-arm64"),
+    ]
+    app_arm = graph.get(("app", "1.0-linux-arm64"))
+    assert graph.dependencies(("app", "1.0-linux-arm64")) == [
+        ("base", "1.0-linux-arm64")
+    ]
+    assert app_arm["build_contexts"] == {
+        "base:1.0": "docker-image://base:1.0-linux-arm64"
+    }
+
+
+def test_expand_platforms_requires_matching_platforms():
+    base = {
+        "name": "base",
+        "tag": "1.0",
+        "platforms": ["linux/amd64"],
+        "actions": ["build"],
+    }
+    dependency = [{"name": "base", "tag": "1.0"}]
+    for app in [
+        {"name": "app", "tag": "1.0", "actions": ["build"]},
+        {"name": "app", "tag": "1.0", "platforms": ["linux/arm64"]},
+    ]:
+        app = {"actions": ["build"], **app, "dependencies": dependency}
+        with pytest.raises(ValueError):
+            expand_platforms([base, app])
+    with pytest.raises(ValueError):
+        validate_images_schema([{**base, "platforms": ["amd64"]}])
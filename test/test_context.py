@@ -0,0 +1,109 @@
+import io
+import os
+import tarfile
+
+from wake_build.context import (
+    SharedContexts,
+    compile_pattern,
+    is_ignored,
+    read_dockerignore,
+    stream_context,
+)
+
+
+def write(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+def test_compile_pattern():
+    assert compile_pattern("*.pyc").fullmatch("a.pyc")
+    assert not compile_pattern("*.pyc").fullmatch("dir/a.pyc")
+    assert compile_pattern("**/*.pyc").fullmatch("a.pyc")
+    assert compile_pattern("**/*.pyc").fullmatch("dir/sub/a.pyc")
+    assert compile_pattern("file?.txt").fullmatch("file1.txt")
+
+
+def test_dockerignore_exceptions(tmp_path):
+    write(tmp_path / ".dockerignore", "# comment\nbuild\n*.md\n!README.md\n")
+    patterns = read_dockerignore(str(tmp_path))
+    assert is_ignored("build", patterns)
+    assert is_ignored("build/output.bin", patterns)
+    assert is_ignored("NOTES.md", patterns)
+    assert not is_ignored("README.md", patterns)
+    assert not is_ignored("src/main.py", patterns)
+
+
+def test_stream_context(tmp_path):
+    context = tmp_path / "app"
+    write(context / ".dockerignore", "secrets\nDockerfile\n")
+    write(context / "Dockerfile", "FROM scratch\n")
+    write(context / "src" / "main.py", "print('hello')\n")
+    write(context / "secrets" / "key", "hunter2\n")
+    write(tmp_path / "other.Dockerfile", "FROM busybox\n")
+
+    data = b"".join(stream_context(str(context)))
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        names = tar.getnames()
+    assert "src/main.py" in names
+    assert "Dockerfile" in names
+    assert not any(name.startswith("secrets") for name in names)
+
+    data = b"".join(
+        stream_context(str(context), str(tmp_path / "other.Dockerfile"))
+    )
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        dockerfile = tar.extractfile(".wake.Dockerfile").read()
+    assert dockerfile == b"FROM busybox\n"
+
+
+def test_shared_contexts_pack_once(tmp_path):
+    context = str(tmp_path / "app")
+    write(os.path.join(context, ".dockerignore"), "*.Dockerfile\nbuild\n")
+    write(os.path.join(context, "main.py"), "print('hello')\n")
+    write(os.path.join(context, "build", "out.bin"), "x" * 1000)
+    images = [
+        {
+            "name": f"service{index}",
+            "context": context,
+            "dockerfile": os.path.join(context, f"service{index}.Dockerfile"),
+        }
+        for index in range(2)
+    ]
+    for image in images:
+        write(image["dockerfile"], "FROM scratch\n")
+    images.append({"name": "other", "context": str(tmp_path / "other")})
+    contexts = SharedContexts(images, str(tmp_path / "contexts"))
+
+    path = contexts.archive(images[0])
+    assert contexts.archive(images[1]) == path
+    assert contexts.archive(images[2]) is None
+    with tarfile.open(path) as tar:
+        assert sorted(tar.getnames()) == [
+            ".dockerignore",
+            "main.py",
+            "service0.Dockerfile",
+            "service1.Dockerfile",
+        ]
+    assert contexts.packed_bytes == os.path.getsize(path)
+    assert contexts.reused_bytes == contexts.packed_bytes
+
+
+def test_shared_contexts_leave_out_wake_state(tmp_path):
+    context = str(tmp_path / "app")
+    cache_dir = os.path.join(context, ".wake-cache")
+    write(os.path.join(context, "main.py"), "print('hello')\n")
+    write(os.path.join(cache_dir, "history.json"), "{}")
+    write(os.path.join(context, "logs", "app.log"), "built\n")
+    images = [
+        {"name": f"service{index}", "context": context} for index in range(2)
+    ]
+    write(os.path.join(context, "Dockerfile"), "FROM scratch\n")
+    contexts = SharedContexts(
+        images,
+        os.path.join(cache_dir, "contexts"),
+        exclude=[cache_dir, os.path.join(context, "logs")],
+    )
+    with tarfile.open(contexts.archive(images[0])) as tar:
+        assert sorted(tar.getnames()) == ["Dockerfile", "main.py"]
@@ -0,0 +1,110 @@
+from wake_build import docker
+from wake_build.executor import CommandExecutor, SimulatedExecutor
+from wake_build.docker import get_registry
+
+
+def test_get_registry():
+    assert get_registry("ubuntu:22.04") == "docker.io"
+    assert get_registry("library/ubuntu:22.04") == "docker.io"
+    assert get_registry("ghcr.io/wake/base:1.0") == "ghcr.io"
+    assert get_registry("localhost:5000/base:1.0") == "localhost:5000"
+    assert get_registry("localhost/base:1.0") == "localhost"
+
+
+def test_build_image_skips_missing_local_cache(tmp_path):
+    executor = SimulatedExecutor()
+    (tmp_path / "base").mkdir()
+    config = {
+        "name": "app",
+        "tag": "1.0",
+        "cache_from": [
+            f"type=local,src={tmp_path / 'base'}",
+            f"type=local,src={tmp_path / 'app'}",
+        ],
+        "cache_to": [f"type=local,dest={tmp_path / 'app'},mode=max"],
+    }
+    assert docker.build_image(config, executor=executor)
+    assert executor.calls[0]["reference"] == "app:1.0"
+    assert executor.calls[0]["command"][4:] == [
+        "--cache-from",
+        f"type=local,src={tmp_path / 'base'}",
+        "--cache-to",
+        f"type=local,dest={tmp_path / 'app'},mode=max",
+        ".",
+    ]
+
+
+def test_build_image_from_context_archive():
+    class RecordingExecutor(CommandExecutor):
+        def run(self, command, live_output=False, output=None, stdin=None):
+            self.command, self.stdin = command, stdin
+            return True
+
+    executor = RecordingExecutor()
+    config = {
+        "name": "app",
+        "tag": "1.0",
+        "context": "app",
+        "dockerfile": "app/service.Dockerfile",
+    }
+    assert docker.build_image(
+        config, executor=executor, context_archive="app.tar"
+    )
+    assert executor.command[4:] == ["--file", "service.Dockerfile", "-"]
+    assert executor.stdin == "app.tar"
+
+
+def test_build_image_for_platform_and_create_manifest():
+    executor = SimulatedExecutor()
+    config = {
+        "name": "app",
+        "tag": "1.0-linux-arm64",
+        "platform": "linux/arm64",
+        "build_contexts": {"base:1.0": "docker-image://base:1.0-linux-arm64"},
+    }
+    assert docker.build_image(config, executor=executor)
+    assert executor.calls[0]["command"][4:] == [
+        "--platform",
+        "linux/arm64",
+        "--build-context",
+        "base:1.0=docker-image://base:1.0-linux-arm64",
+        ".",
+    ]
+    config = {
+        "name": "app",
+        "tag": "1.0",
+        "platforms": ["linux/amd64", "linux/arm64"],
+    }
+    assert docker.create_manifest(config, prefix="r.io/", executor=executor)
+    assert executor.calls[1]["action"] == "manifest"
+    assert executor.calls[1]["command"][4:] == [
+        "--tag",
+        "r.io/app:1.0",
+        "r.io/app:1.0-linux-amd64",
+        "r.io/app:1.0-linux-arm64",
+    ]
+
+
+def test_build_image_falls_back_to_cli_for_cache_exports(tmp_path):
+    class Client:
+        def build(self, reference, **kwargs):
+            self.kwargs = kwargs
+            return True
+
+    executor = SimulatedExecutor()
+    client = Client()
+    config = {"name": "app", "tag": "1.0"}
+    registry_cache = {"cache_from": ["type=registry,ref=r.io/app:cache"]}
+    assert docker.build_image(
+        {**config, **registry_cache}, client=client, executor=executor
+    )
+    assert client.kwargs["cache_from"] == ["r.io/app:cache"]
+    (tmp_path / "cache").mkdir()
+    for cache in [
+        {"cache_to": [f"type=local,dest={tmp_path / 'cache'}"]},
+        {"cache_from": [f"type=local,src={tmp_path / 'cache'}"]},
+    ]:
+        assert docker.build_image(
+            {**config, **cache}, client=client, executor=executor
+        )
+    assert len(executor.calls) == 2
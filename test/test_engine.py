@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import socketserver
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from wake_build.engine import EngineClient, split_reference
+
+
+class FakeDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return body
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def respond(self, status, messages):
+        body = b"".join(json.dumps(m).encode() + b"\r\n" for m in messages)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.read_body()
+        self.server.requests.append((self.path, self.headers, body))
+        if self.path.startswith("/build"):
+            with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                names = tar.getnames()
+            self.respond(200, [{"stream": f"Context {sorted(names)}\n"}])
+        elif self.path.startswith("/images/create"):
+            if "missing" in self.path:
+                self.respond(200, [{"error": "manifest unknown"}])
+            else:
+                self.respond(200, [{"status": "Pulled"}])
+        elif "/tag?" in self.path:
+            self.respond(201, [])
+        else:
+            self.respond(200, [{"status": "Pushed"}])
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers, b""))
+        if self.path == "/images/base:1.0/json":
+            self.respond(200, [{"Id": "sha256:abc"}])
+        else:
+            self.respond(404, [{"message": "No such image"}])
+
+
+class FakeDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, FakeDaemonHandler)
+        self.requests = []
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    server = FakeDaemon(str(tmp_path / "docker.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_split_reference():
+    assert split_reference("base:1.0") == ("base", "1.0")
+    assert split_reference("base") == ("base", "latest")
+    assert split_reference("localhost:5000/base") == (
+        "localhost:5000/base",
+        "latest",
+    )
+    assert split_reference("localhost:5000/base:1.0") == (
+        "localhost:5000/base",
+        "1.0",
+    )
+
+
+def test_engine_client_reuses_connection(daemon, tmp_path):
+    context = tmp_path / "app"
+    os.makedirs(context)
+    (context / "Dockerfile").write_text("FROM scratch\n")
+    (context / "main.py").write_text("print('hello')\n")
+    client = EngineClient(f"unix://{daemon.server_address}")
+
+    assert client.build(
+        "app:1.0",
+        context=str(context),
+        target="release",
+        build_args={"A": "1"},
+    )
+    assert client.pull("base:1.0")
+    assert not client.pull("missing:1.0")
+    assert client.tag("app:1.0", "registry.local/app:1.0")
+    assert client.push("registry.local/app:1.0")
+    assert client.inspect_image("base:1.0") == {"Id": "sha256:abc"}
+    assert client.inspect_image("other:1.0") is None
+    client.close()
+
+    assert daemon.connections == 1
+    path, headers, _ = daemon.requests[0]
+    assert path.startswith("/build?")
+    assert "target=release" in path
+    assert headers["Content-Type"] == "application/x-tar"
+    assert "X-Registry-Auth" in daemon.requests[-3][1]
+
+
+def test_engine_client_streams_builds_on_fresh_connections(daemon, tmp_path):
+    class StaleConnection:
+        def request(self, *args, **kwargs):
+            raise ConnectionResetError()
+
+        def close(self):
+            pass
+
+    context = tmp_path / "app"
+    os.makedirs(context)
+    (context / "Dockerfile").write_text("FROM scratch\n")
+    client = EngineClient(f"unix://{daemon.server_address}")
+    client.pool.put(StaleConnection())
+    assert client.build("app:1.0", context=str(context))
+    # Requests with a plain body retry on a new connection
+    assert client.pull("base:1.0")
+    client.close()
+
+
+def test_engine_client_leaves_excluded_paths_out_of_contexts(daemon, tmp_path):
+    context = tmp_path / "app"
+    os.makedirs(context / ".wake-cache")
+    (context / "Dockerfile").write_text("FROM scratch\n")
+    (context / ".wake-cache" / "journal.jsonl").write_text("")
+    client = EngineClient(
+        f"unix://{daemon.server_address}",
+        exclude=[str(context / ".wake-cache")],
+    )
+    assert client.build("app:1.0", context=str(context))
+    client.close()
+    _, _, body = daemon.requests[0]
+    with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+        assert tar.getnames() == ["Dockerfile"]
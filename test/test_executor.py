@@ -0,0 +1,57 @@
+import pytest
+
+from wake_build import wake
+from wake_build.executor import SimulatedExecutor, describe_command
+
+images_data = [
+    {"name": "base", "tag": "1.0", "actions": ["build"]},
+] + [
+    {
+        "name": f"app{index}",
+        "tag": "1.0",
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+        "actions": ["build", "tag", "push"],
+    }
+    for index in range(4)
+]
+
+
+def test_describe_command():
+    assert describe_command(
+        ["docker", "build", "--tag", "app:1.0", "--target", "x", "."]
+    ) == ("build", "app:1.0")
+    assert describe_command(["docker", "tag", "app:1.0", "r/app:1.0"]) == (
+        "tag",
+        "app:1.0",
+    )
+    assert describe_command(["docker", "push", "r/app:1.0"]) == (
+        "push",
+        "r/app:1.0",
+    )
+    assert describe_command(["docker", "buildx", "bake", "default"]) == (
+        "bake",
+        "",
+    )
+
+
+def test_simulated_builds_run_in_parallel():
+    executor = SimulatedExecutor(default_duration=0.05)
+    wake.build_images(images_data, jobs=2, executor=executor)
+    calls = sorted(executor.calls, key=lambda call: call["start"])
+    assert calls[0]["reference"] == "base:1.0"
+    assert all(call["start"] >= calls[0]["end"] for call in calls[1:])
+    assert executor.peak == 2
+
+
+def test_simulated_failure_stops_scheduling():
+    executor = SimulatedExecutor(
+        durations={"build app0:1.0": 0.01},
+        failures=["build app0:1.0"],
+        default_duration=0.1,
+    )
+    with pytest.raises(SystemExit):
+        wake.build_images(images_data, jobs=2, executor=executor)
+    failed = [call for call in executor.calls if not call["success"]]
+    assert len(failed) == 1
+    # Nothing was started once the failure was seen
+    assert all(call["start"] < failed[0]["end"] for call in executor.calls)
@@ -0,0 +1,88 @@
+from wake_build.history import (
+    DEFAULT_DURATION,
+    BuildHistory,
+    simulate_schedule,
+    upward_ranks,
+)
+from wake_build.scheduler import run_graph
+from wake_build.wake import UNCHANGED, run_steps
+
+
+dependencies = {
+    "base": [],
+    "long1": ["base"],
+    "long2": ["long1"],
+    "short": ["base"],
+}
+durations = {"base": 1.0, "long1": 5.0, "long2": 5.0, "short": 1.0}
+
+
+def test_upward_ranks():
+    assert upward_ranks(dependencies, durations) == {
+        "base": 11.0,
+        "long1": 10.0,
+        "long2": 5.0,
+        "short": 1.0,
+    }
+
+
+def test_simulate_schedule_prefers_long_chains():
+    schedule = simulate_schedule(dependencies, durations, jobs=1)
+    assert [node for _, _, _, node in schedule] == [
+        "base",
+        "long1",
+        "long2",
+        "short",
+    ]
+    schedule = simulate_schedule(dependencies, durations, jobs=2)
+    assert max(end for _, end, _, _ in schedule) == 11.0
+
+
+def test_run_graph_starts_highest_priority_first():
+    started = []
+    nodes = {"a": [], "b": [], "c": []}
+    run_graph(
+        nodes,
+        nodes,
+        lambda node: started.append(node) or True,
+        priority={"a": 1, "b": 3, "c": 2},
+    )
+    assert started == ["b", "c", "a"]
+
+
+def test_build_history(tmp_path):
+    history = BuildHistory(str(tmp_path))
+    assert history.estimate("build a:1") == DEFAULT_DURATION
+    history.record("build a:1", 10.0)
+    history.record("build a:1", 20.0)
+    history.save()
+    history = BuildHistory(str(tmp_path), read_only=True)
+    assert history.estimate("build a:1") == 15.0
+    assert history.estimate("build b:1") == 15.0
+    history.record("build a:1", 100.0)
+    assert history.estimate("build a:1") == 15.0
+
+
+def test_estimate_averages_follow_recorded_durations(tmp_path):
+    history = BuildHistory(str(tmp_path))
+    history.record("build a:1", 2.0)
+    assert history.estimate("build b:1") == 2.0
+    history.record("build c:1", 4.0)
+    assert history.estimate("build b:1") == 3.0
+    assert history.estimate("push b:1") == DEFAULT_DURATION
+
+
+def test_run_steps_records_only_steps_that_did_their_work(tmp_path):
+    history = BuildHistory(str(tmp_path))
+    history.record("build a:1", 600.0)
+    steps = {("build", ("a", "1")): [], ("build", ("b", "1")): []}
+    results = {("a", "1"): UNCHANGED, ("b", "1"): True}
+    run_steps(
+        steps,
+        lambda step: results[step[1]],
+        "build",
+        "Building",
+        history=history,
+    )
+    assert history.estimate("build a:1") == 600.0
+    assert "build b:1" in BuildHistory(str(tmp_path)).durations
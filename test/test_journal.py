@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from wake_build import cache, journal, wake
+from wake_build.journal import JOURNAL_FILE, RunJournal
+
+
+images_data = [
+    {
+        "name": "base",
+        "tag": "1.0",
+        "context": "base",
+        "actions": ["build"],
+    },
+    {
+        "name": "app",
+        "tag": "1.0",
+        "context": "app",
+        "actions": ["build", "push"],
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+    },
+]
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+@pytest.fixture
+def contexts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("base/Dockerfile", "FROM scratch\n")
+    write("app/Dockerfile", "FROM base:1.0\n")
+    existing = {"base:1.0", "app:1.0"}
+    monkeypatch.setattr(
+        journal,
+        "inspect_image",
+        lambda reference, **_: {"Id": "1"} if reference in existing else None,
+    )
+    return existing
+
+
+def test_resumed_journal_skips_completed_steps(contexts):
+    base, app = images_data
+    run = RunJournal(images_data, ".wake-cache")
+    run.record("build", base)
+    run.record("build", app)
+    run.close()
+    with open(os.path.join(".wake-cache", JOURNAL_FILE), "a") as file:
+        file.write('{"step": "push app')
+
+    resumed = RunJournal(images_data, ".wake-cache", resume=True)
+    assert resumed.is_done("build", base)
+    assert not resumed.is_done("push", app)
+    contexts.discard("app:1.0")
+    assert not resumed.is_done("build", app)
+    resumed.close()
+
+    write("base/Dockerfile", "FROM busybox\n")
+    resumed = RunJournal(images_data, ".wake-cache", resume=True)
+    assert not resumed.is_done("build", base)
+    resumed.close()
+
+    assert not RunJournal(images_data, ".wake-cache").is_done("build", base)
+
+
+def test_resume_continues_failed_run(contexts, monkeypatch):
+    built = []
+    pushed = []
+
+    def build_image(config, **_):
+        built.append(config["name"])
+        return True
+
+    def push_image(config, **_):
+        pushed.append(config["name"])
+        return len(pushed) > 1
+
+    monkeypatch.setattr(wake, "build_image", build_image)
+    monkeypatch.setattr(wake, "push_image", push_image)
+    run = RunJournal(images_data, ".wake-cache")
+    with pytest.raises(SystemExit):
+        wake.build_tag_push_images(images_data, retries=0, journal=run)
+    run.close()
+    assert built == ["base", "app"]
+
+    run = RunJournal(images_data, ".wake-cache", resume=True)
+    wake.build_tag_push_images(images_data, retries=0, journal=run)
+    run.close()
+    assert built == ["base", "app"]
+    assert pushed == ["app", "app"]
+
+
+def test_resumed_pushes_are_checked_against_the_registry(contexts, monkeypatch):
+    def hash_directory(*_, **__):
+        raise AssertionError("pushes do not hash contexts")
+
+    def get_digest(reference):
+        raise AssertionError("only resumed runs ask the registry")
+
+    monkeypatch.setattr(cache, "hash_directory", hash_directory)
+    info = {"Id": "1", "RepoDigests": ["r.io/app@sha256:1", "app@sha256:0"]}
+    monkeypatch.setattr(journal, "inspect_image", lambda *_, **__: info)
+    _, app = images_data
+    run = RunJournal(images_data, ".wake-cache", resolve_digest=get_digest)
+    run.record("push", app, "r.io/")
+    run.close()
+
+    registry = {"r.io/app:1.0": "sha256:1"}
+    resumed = RunJournal(
+        images_data, ".wake-cache", resume=True, resolve_digest=registry.get
+    )
+    assert resumed.is_done("push", app, "r.io/")
+    registry["r.io/app:1.0"] = "sha256:2"
+    assert not resumed.is_done("push", app, "r.io/")
+    resumed.close()
@@ -0,0 +1,109 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wake_build import registry
+from wake_build.registry import (
+    DigestChecker,
+    RegistryClient,
+    parse_challenge,
+    parse_reference,
+)
+
+DIGEST = "sha256:" + "a" * 64
+
+
+class FakeRegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.server.requests.append(self.path)
+        if self.headers.get("Authorization") != "Bearer secret":
+            realm = f"http://127.0.0.1:{self.server.server_port}/token"
+            self.send_response(401)
+            self.send_header(
+                "WWW-Authenticate",
+                f'Bearer realm="{realm}",service="fake",'
+                'scope="repository:team/app:pull"',
+            )
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/v2/team/app/manifests/1.0":
+            self.send_response(200)
+            self.send_header("Docker-Content-Digest", DIGEST)
+        else:
+            self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = json.dumps({"token": "secret"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def fake_registry():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRegistryHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_reference():
+    assert parse_reference("base:1.0") == ("docker.io", "library/base", "1.0")
+    assert parse_reference("team/app") == ("docker.io", "team/app", "latest")
+    assert parse_reference("localhost:5000/team/app:1.0") == (
+        "localhost:5000",
+        "team/app",
+        "1.0",
+    )
+
+
+def test_parse_challenge():
+    assert parse_challenge('Bearer realm="https://auth/token",scope="x"') == {
+        "realm": "https://auth/token",
+        "scope": "x",
+    }
+    assert parse_challenge('Basic realm="registry"') is None
+
+
+def test_registry_client_follows_token_flow(fake_registry):
+    host = f"127.0.0.1:{fake_registry.server_port}"
+    client = RegistryClient(auths={})
+    assert client.get_digest(f"{host}/team/app:1.0") == DIGEST
+    assert client.get_digest(f"{host}/team/app:2.0") is None
+    # The token is reused for further lookups in the same repository
+    tokens = [path for path in fake_registry.requests if "/token" in path]
+    assert tokens == [
+        "/token?service=fake&scope=repository%3Ateam%2Fapp%3Apull"
+    ]
+
+
+def test_digest_checker_compares_local_repo_digests(fake_registry, monkeypatch):
+    host = f"127.0.0.1:{fake_registry.server_port}"
+    local = {
+        f"{host}/team/app:1.0": {"RepoDigests": [f"{host}/team/app@{DIGEST}"]},
+        f"{host}/team/app:2.0": {"RepoDigests": []},
+    }
+    monkeypatch.setattr(
+        registry, "inspect_image", lambda reference, **_: local.get(reference)
+    )
+    checker = DigestChecker(RegistryClient(auths={}))
+    assert checker.is_current(f"{host}/team/app:1.0")
+    assert not checker.is_current(f"{host}/team/app:2.0")
+    assert not checker.is_current(f"{host}/team/other:1.0")
+    assert (checker.checked, checker.skipped) == (3, 1)
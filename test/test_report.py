@@ -0,0 +1,40 @@
+import time
+
+from wake_build.report import RunReport
+from wake_build.scheduler import run_graph
+
+
+def test_scheduler_records_tasks_and_critical_path():
+    report = RunReport()
+    durations = {"base": 0.01, "fast": 0.01, "slow": 0.05, "app": 0.01}
+    dependencies = {
+        "base": [],
+        "fast": ["base"],
+        "slow": ["base"],
+        "app": ["fast", "slow"],
+    }
+
+    def func(node):
+        time.sleep(durations[node])
+        return True
+
+    with report.phase("build"):
+        run_graph(dependencies, dependencies, func, jobs=2, report=report)
+    data = report.to_dict()
+    assert [phase["name"] for phase in data["phases"]] == ["build"]
+    assert len(data["tasks"]) == 4
+    for task in data["tasks"]:
+        assert task["outcome"] == "success"
+        assert task["queue_wait"] >= 0
+        assert task["end"] >= task["start"]
+    assert data["critical_path"]["tasks"] == ["base", "slow", "app"]
+    assert data["critical_path"]["duration"] >= 0.07
+
+    events = report.trace_events()
+    assert {event["name"] for event in events if event["ph"] == "X"} == {
+        "build",
+        "base",
+        "fast",
+        "slow",
+        "app",
+    }
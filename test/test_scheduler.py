@@ -0,0 +1,177 @@
+import threading
+import time
+
+from wake_build.scheduler import run_graph, SUCCESS, FAILED, SKIPPED
+
+
+dependencies = {
+    "base": [],
+    "app1": ["base"],
+    "app2": ["base"],
+    "service": ["app1", "app2"],
+}
+
+
+def test_run_graph_respects_dependencies():
+    finished = []
+
+    def func(node):
+        for dep in dependencies[node]:
+            assert dep in finished, f"{node} started before {dep}"
+        finished.append(node)
+        return True
+
+    outcomes = run_graph(dependencies, dependencies, func, jobs=4)
+    assert outcomes == {node: SUCCESS for node in dependencies}
+    assert finished[0] == "base" and finished[-1] == "service"
+
+
+def test_run_graph_runs_ready_nodes_concurrently():
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def func(node):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return True
+
+    run_graph(dependencies, dependencies, func, jobs=4)
+    assert peak[0] == 2, f"Expected app1 and app2 to overlap, got {peak[0]}"
+
+
+def test_run_graph_fail_fast():
+    def func(node):
+        return node != "base"
+
+    outcomes = run_graph(dependencies, dependencies, func, jobs=1)
+    assert outcomes == {
+        "base": FAILED,
+        "app1": SKIPPED,
+        "app2": SKIPPED,
+        "service": SKIPPED,
+    }
+
+
+def test_run_graph_keep_going():
+    def func(node):
+        return node != "app1"
+
+    completed = {}
+    outcomes = run_graph(
+        dependencies,
+        dependencies,
+        func,
+        jobs=1,
+        keep_going=True,
+        on_complete=completed.__setitem__,
+    )
+    assert outcomes == {
+        "base": SUCCESS,
+        "app1": FAILED,
+        "app2": SUCCESS,
+        "service": SKIPPED,
+    }
+    assert completed == outcomes
+
+
+def test_run_graph_cycle_is_skipped():
+    outcomes = run_graph(["a", "b"], {"a": ["b"], "b": ["a"]}, bool)
+    assert outcomes == {"a": SKIPPED, "b": SKIPPED}
+
+
+def test_run_graph_limits_concurrency_per_key():
+    lock = threading.Lock()
+    active = {}
+    peak = {}
+
+    def func(node):
+        key = node[0]
+        with lock:
+            active[key] = active.get(key, 0) + 1
+            peak[key] = max(peak.get(key, 0), active[key])
+        time.sleep(0.02)
+        with lock:
+            active[key] -= 1
+        return True
+
+    nodes = ["a1", "a2", "a3", "b1", "b2", "b3"]
+    outcomes = run_graph(
+        nodes, {}, func, jobs=6, limit_key=lambda node: node[0], limit=1
+    )
+    assert set(outcomes.values()) == {SUCCESS}
+    assert peak == {"a": 1, "b": 1}
+
+
+def test_run_graph_packs_nodes_within_capacity():
+    demands = {
+        "big": (2, 6),
+        "small1": (1, 2),
+        "small2": (1, 2),
+        "huge": (8, 1),
+    }
+    lock = threading.Lock()
+    running = set()
+    overlaps = []
+    starts = []
+
+    def func(node):
+        with lock:
+            running.add(node)
+            overlaps.append(set(running))
+            starts.append(node)
+        time.sleep(0.05)
+        with lock:
+            running.discard(node)
+        return True
+
+    outcomes = run_graph(
+        list(demands),
+        {},
+        func,
+        jobs=4,
+        demand=demands.get,
+        capacity=(4, 8),
+        priority={"big": 3, "huge": 2, "small1": 1, "small2": 0},
+    )
+    assert set(outcomes.values()) == {SUCCESS}
+    for started in overlaps:
+        used = [sum(demands[node][i] for node in started) for i in range(2)]
+        assert (
+            "huge" in started
+            and len(started) == 1
+            or (used[0] <= 4 and used[1] <= 8)
+        )
+    # The small nodes wait behind huge instead of delaying it
+    assert starts[:2] == ["big", "huge"]
+
+
+def test_run_graph_reserves_capacity_for_blocked_node():
+    demands = {"first": (2,), "big": (4,)}
+    demands.update({f"s{index}": (1,) for index in range(7)})
+    priority = {"first": 100, "big": 99}
+    lock = threading.Lock()
+    starts = []
+
+    def func(node):
+        with lock:
+            starts.append(node)
+        time.sleep(0.02)
+        return True
+
+    outcomes = run_graph(
+        list(demands),
+        {},
+        func,
+        jobs=8,
+        demand=demands.get,
+        capacity=(4,),
+        priority=priority,
+    )
+    assert set(outcomes.values()) == {SUCCESS}
+    # Big starts as soon as first frees its capacity, ahead of the backfill
+    assert starts[:2] == ["first", "big"]
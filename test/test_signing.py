@@ -0,0 +1,78 @@
+import json
+import threading
+
+from wake_build import wake
+from wake_build.executor import SimulatedExecutor
+from wake_build.signing import LocalSigner, Signer
+
+DIGEST = "sha256:" + "b" * 64
+
+images_data = [
+    {
+        "name": f"app{index}",
+        "tag": "1.0",
+        "actions": ["build", "push", "sign"],
+    }
+    for index in range(3)
+]
+
+
+class RecordingSigner(Signer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.signed = []
+
+    def sign_batch(self, references, **_):
+        self.signed.append(sorted(references))
+        return True
+
+
+def test_signer_batches_concurrent_calls():
+    signer = RecordingSigner(batch_size=3, batch_delay=5)
+    threads = [
+        threading.Thread(target=signer.sign, args=(f"app{index}:1.0",))
+        for index in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert signer.signed == [["app0:1.0", "app1:1.0", "app2:1.0"]]
+
+
+def test_local_signer_signs_by_digest(tmp_path):
+    signer = LocalSigner(str(tmp_path), resolve_digest=lambda _: DIGEST)
+    assert signer.sign("registry.local/app:1.0")
+    (path,) = tmp_path.iterdir()
+    signature = json.loads(path.read_text())
+    assert signature["reference"] == f"registry.local/app@{DIGEST}"
+    assert not LocalSigner(str(tmp_path), resolve_digest=lambda _: None).sign(
+        "registry.local/other:1.0"
+    )
+
+
+def test_pipeline_signs_each_image_after_its_push(tmp_path):
+    executor = SimulatedExecutor(default_duration=0.01)
+    signed = []
+
+    class Signer(RecordingSigner):
+        def sign_batch(self, references, **_):
+            pushed = {
+                call["reference"]
+                for call in executor.calls
+                if call["action"] == "push"
+            }
+            assert set(references) <= pushed
+            signed.extend(references)
+            return True
+
+    wake.build_tag_push_images(
+        images_data,
+        prefix="registry.local/",
+        jobs=3,
+        executor=executor,
+        signer=Signer(),
+    )
+    assert sorted(signed) == [
+        f"registry.local/app{index}:1.0" for index in range(3)
+    ]
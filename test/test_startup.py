@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+# Modules only some code paths need, which must not be imported at startup
+DEFERRED_MODULES = ["tqdm", "yaml", "dotenv", "subprocess", "http.client"]
+# Generous limit on the cumulative import time of the package, in seconds
+IMPORT_BUDGET = 0.25
+
+
+def import_times(module):
+    """
+    Return the cumulative import time in seconds of every module imported
+    when importing module in a fresh interpreter
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.decode().splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1]) / 1e6
+    return times
+
+
+def test_startup_defers_heavy_imports():
+    times = import_times("wake_build.wake")
+    assert not [module for module in DEFERRED_MODULES if module in times]
+
+
+def test_startup_import_budget():
+    times = import_times("wake_build.wake")
+    assert times["wake_build"] < IMPORT_BUDGET
@@ -0,0 +1,47 @@
+import sys
+
+from wake_build.util import CommandOutput, retry, run_command
+
+
+def test_command_output_keeps_bounded_tail():
+    output = CommandOutput(tail_size=10)
+    for i in range(100):
+        output.write(f"{i}\n")
+    assert output.tail() == b"97\n98\n99\n"
+    output.write("x" * 50)
+    assert output.tail() == b"x" * 9 + b"\n"
+
+
+def test_run_command_streams_to_log_file(tmp_path, capsysbinary):
+    output = CommandOutput(
+        name="app:1.0",
+        live_output=True,
+        log_dir=str(tmp_path),
+        prefix_output=True,
+    )
+    command = [sys.executable, "-c", "print('one'); print('two')"]
+    assert run_command(command, output=output)
+    log = (tmp_path / "app_1.0.log").read_bytes()
+    assert log.endswith(b"one\ntwo\n")
+    assert capsysbinary.readouterr().out == b"[app:1.0] one\n[app:1.0] two\n"
+
+
+def test_run_command_reports_tail_on_failure(capsysbinary):
+    command = [
+        sys.executable,
+        "-c",
+        "import sys; print('building'); sys.exit('broken')",
+    ]
+    assert not run_command(command)
+    assert capsysbinary.readouterr().out == b"building\nbroken\n"
+
+
+def test_retry():
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        return len(attempts) == 3
+
+    assert retry(func, retries=2, delay=0)
+    assert not retry(lambda: False, retries=1, delay=0)
@@ -1 +1,166 @@
-# TODO mock run_command and call various wake action functions
\ No newline at end of file
+import pytest
+
+from wake_build import wake
+from wake_build.executor import SimulatedExecutor
+
+
+images_data = [
+    {
+        "name": "base",
+        "tag": "1.0",
+        "actions": ["build"],
+    },
+    {
+        "name": "app1",
+        "tag": "1.0",
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+        "actions": ["build", "tag", "push"],
+    },
+    {
+        "name": "app2",
+        "tag": "1.0",
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+        "actions": ["build", "tag", "push"],
+    },
+]
+
+
+def test_build_images_builds_dependencies_first(monkeypatch):
+    built = []
+
+    def build_image(config, **_):
+        built.append(config["name"])
+        return True
+
+    monkeypatch.setattr(wake, "build_image", build_image)
+    wake.build_images(images_data, ["app1"], jobs=2)
+    assert built == ["base", "app1"]
+
+
+def test_build_images_exits_on_failure(monkeypatch):
+    built = []
+
+    def build_image(config, **_):
+        built.append(config["name"])
+        return config["name"] != "app1"
+
+    monkeypatch.setattr(wake, "build_image", build_image)
+    with pytest.raises(SystemExit):
+        wake.build_images(images_data, jobs=1, keep_going=True)
+    assert sorted(built) == ["app1", "app2", "base"]
+
+
+def test_push_images_retries_failures(monkeypatch):
+    attempts = []
+
+    def push_image(config, prefix="", **_):
+        attempts.append(f"{prefix}{config['name']}")
+        return attempts.count(f"{prefix}{config['name']}") > 1
+
+    monkeypatch.setattr(wake, "push_image", push_image)
+    wake.push_images(
+        images_data,
+        prefix="registry.local/",
+        jobs=2,
+        registry_jobs=1,
+        retries=1,
+        retry_delay=0,
+    )
+    assert sorted(attempts) == [
+        "registry.local/app1",
+        "registry.local/app1",
+        "registry.local/app2",
+        "registry.local/app2",
+    ]
+
+
+def test_build_tag_push_images_pipelines_each_image(monkeypatch):
+    events = []
+
+    def record(action):
+        def operation(config, **_):
+            events.append((action, config["name"]))
+            return True
+
+        return operation
+
+    for action in ["build", "tag", "push"]:
+        monkeypatch.setattr(wake, f"{action}_image", record(action))
+    wake.build_tag_push_images(images_data, prefix="registry.local/", jobs=1)
+    assert len(events) == 7
+    for name in ["app1", "app2"]:
+        build = events.index(("build", name))
+        tag = events.index(("tag", name))
+        push = events.index(("push", name))
+        assert events.index(("build", "base")) < build < tag < push
+
+
+def test_push_images_skips_current_digests(monkeypatch):
+    pushed = []
+
+    class Checker:
+        checked = skipped = 0
+
+        def is_current(self, reference):
+            return reference == "registry.local/app1:1.0"
+
+        def log_summary(self):
+            pass
+
+    def push_image(config, prefix="", **_):
+        pushed.append(f"{prefix}{config['name']}")
+        return True
+
+    monkeypatch.setattr(wake, "push_image", push_image)
+    wake.push_images(
+        images_data, prefix="registry.local/", digest_checker=Checker()
+    )
+    assert pushed == ["registry.local/app2"]
+
+
+def test_build_tag_push_images_assembles_multi_platform_manifests():
+    executor = SimulatedExecutor(default_duration=0.05)
+    images = wake.prepare_images(
+        [
+            {
+                "name": "base",
+                "tag": "1.0",
+                "platforms": ["linux/amd64", "linux/arm64"],
+                "actions": ["build", "push"],
+            },
+            {
+                "name": "app",
+                "tag": "1.0",
+                "platforms": ["linux/amd64", "linux/arm64"],
+                "actions": ["build", "push"],
+                "dependencies": [{"name": "base", "tag": "1.0"}],
+            },
+        ]
+    )
+    wake.build_tag_push_images(
+        images, prefix="r.io/", jobs=4, retries=0, executor=executor
+    )
+    calls = {
+        (call["action"], call["reference"]): call for call in executor.calls
+    }
+    assert len(calls) == 10
+    for name in ["base", "app"]:
+        manifest = calls[("manifest", f"r.io/{name}:1.0")]
+        for platform in ["linux-amd64", "linux-arm64"]:
+            push = calls[("push", f"r.io/{name}:1.0-{platform}")]
+            assert push["end"] <= manifest["start"]
+            build = calls[("build", f"{name}:1.0-{platform}")]
+            if name == "app":
+                base = calls[("build", f"base:1.0-{platform}")]
+                assert base["end"] <= build["start"]
+    # The platforms of an image build side by side
+    assert executor.peak >= 2
+
+
+@pytest.mark.parametrize("option", ["--jobs", "--registry-jobs"])
+def test_main_rejects_job_counts_below_one(option, monkeypatch):
+    monkeypatch.setattr("sys.argv", ["wake", option, "0", "build"])
+    with pytest.raises(SystemExit) as excinfo:
+        wake.main()
+    assert excinfo.value.code == 2
+    assert wake.positive_int("4") == 4
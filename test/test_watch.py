@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from wake_build import wake
+from wake_build.executor import SimulatedExecutor
+from wake_build.watch import InotifyWatcher, PollingWatcher, collect_changes
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_polling_watcher_finds_changes(tmp_path):
+    (tmp_path / "context").mkdir()
+    (tmp_path / "context" / "file").write_text("a")
+    watcher = PollingWatcher([str(tmp_path / "context")], interval=0.01)
+    assert watcher.poll(0) == set()
+    (tmp_path / "context" / "file").write_text("changed")
+    (tmp_path / "context" / "new").write_text("b")
+    assert watcher.poll(1) == {
+        str(tmp_path / "context" / "file"),
+        str(tmp_path / "context" / "new"),
+    }
+
+
+def test_inotify_watcher_finds_changes_in_new_directories(tmp_path):
+    try:
+        watcher = InotifyWatcher([str(tmp_path)])
+    except (OSError, AttributeError):
+        pytest.skip("inotify is unavailable")
+    try:
+        (tmp_path / "sub").mkdir()
+        assert str(tmp_path / "sub") in watcher.poll(1)
+        (tmp_path / "sub" / "file").write_text("a")
+        assert str(tmp_path / "sub" / "file") in watcher.poll(1)
+    finally:
+        watcher.close()
+
+
+def test_collect_changes_debounces_bursts(tmp_path):
+    watcher = PollingWatcher([str(tmp_path)], interval=0.01)
+
+    def write_files():
+        for index in range(3):
+            (tmp_path / f"file{index}").write_text("a")
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=write_files)
+    thread.start()
+    changed = collect_changes(watcher, 1, 0.2)
+    thread.join()
+    assert len(changed) == 3
+
+
+images_data = [
+    {"name": "base", "tag": "1.0", "context": "base", "actions": ["build"]},
+    {
+        "name": "app",
+        "tag": "1.0",
+        "context": "app",
+        "dependencies": [{"name": "base", "tag": "1.0"}],
+        "actions": ["build"],
+    },
+]
+
+
+def start_watch(executor, stop):
+    thread = threading.Thread(
+        target=wake.watch_images,
+        args=(images_data,),
+        kwargs=dict(debounce=0.05, polling=True, stop=stop, executor=executor),
+    )
+    thread.start()
+    return thread
+
+
+def built(executor):
+    return [call["reference"] for call in executor.calls]
+
+
+def test_watch_images_rebuilds_changed_images_and_dependents(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wake, "WATCH_INTERVAL", 0.05)
+    for name in ["base", "app"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "Dockerfile").write_text("FROM scratch")
+    executor = SimulatedExecutor()
+    stop = threading.Event()
+    thread = start_watch(executor, stop)
+    try:
+        wait_for(lambda: len(executor.calls) == 2)
+        (tmp_path / "app" / "Dockerfile").write_text("FROM busybox")
+        wait_for(lambda: len(executor.calls) == 3)
+        (tmp_path / "base" / "file").write_text("a")
+        wait_for(lambda: len(executor.calls) == 5)
+    finally:
+        stop.set()
+        thread.join()
+    assert built(executor) == [
+        "base:1.0",
+        "app:1.0",
+        "app:1.0",
+        "base:1.0",
+        "app:1.0",
+    ]
+
+
+def test_watch_images_cancels_superseded_builds(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wake, "WATCH_INTERVAL", 0.05)
+    for name in ["base", "app"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "Dockerfile").write_text("FROM scratch")
+    executor = SimulatedExecutor(durations={"build app:1.0": 10})
+    stop = threading.Event()
+    thread = start_watch(executor, stop)
+    start = time.monotonic()
+    try:
+        wait_for(lambda: executor.running and len(executor.calls) == 1)
+        (tmp_path / "app" / "Dockerfile").write_text("FROM busybox")
+        # The cancelled round is started again along with the new changes
+        wait_for(lambda: executor.running and len(executor.calls) == 3)
+    finally:
+        stop.set()
+        thread.join()
+    assert time.monotonic() - start < 10
+    assert [call["success"] for call in executor.calls[:2]] == [True, False]